@@ -0,0 +1,214 @@
+"""
+Micro-benchmarks for document generation, no source is contacted.
+Every case runs in a fresh process so its peak RSS is measured in isolation, results are printed as JSON.
+
+Usage:
+    python -m Docloader.benchmark
+    python -m Docloader.benchmark --sizes 256 65536 --benchmarks generate_doc_batch --output results.json
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import time
+
+import faker
+
+import Docloader.docgen_template as template
+import Docloader.wire_format as wire_format
+from Docloader.doc_loader import DocLoader
+from SDKs.s3.s3_operations import s3Operations
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, peak RSS is then not reported
+    resource = None
+
+BENCHMARKS = ("generate_docs", "generate_fake_documents_concurrently", "generate_doc_batch",
+              "hotel_generate_document", "s3_generate_data")
+DOCUMENT_SIZES = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+GENERATION_MODES = ("faker", "vocabulary")
+THREAD_COUNTS = (1, 4)
+PROCESS_COUNTS = (0, 2)
+FORMATS = (None,) + wire_format.WIRE_FORMATS
+
+
+def encoded_document_size(document, output_format=None):
+    """
+    Size in bytes of a generated document in the given format
+    """
+    if output_format == "bson":
+        return len(document.raw)
+    elif output_format == "dynamodb":
+        return wire_format.dynamodb_item_size(document)
+    elif output_format == "mysql":
+        return len(json.dumps(document).encode("utf-8"))
+    return template.encoded_size(document)
+
+
+def peak_rss_kb(who):
+    """
+    Peak resident set size in KB of this process or of its terminated children
+    """
+    if not resource:
+        return None
+    max_rss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB everywhere else
+    return max_rss // 1024 if sys.platform == "darwin" else max_rss
+
+
+def _generator(benchmark, document_size, generation_mode, threads, processes, output_format):
+    """
+    Return a function generating a batch of documents for the benchmark, and the loader to shut down
+    """
+    doc_loader = DocLoader(document_size=document_size, generation_mode=generation_mode,
+                           num_generator_processes=processes)
+    if benchmark == "generate_docs":
+        return lambda count: [doc_loader.generate_docs() for _ in range(count)], doc_loader
+    elif benchmark == "generate_fake_documents_concurrently":
+        return lambda count: doc_loader.generate_fake_documents_concurrently(count, threads), doc_loader
+    elif benchmark == "generate_doc_batch":
+        return lambda count: doc_loader.generate_doc_batch(count, output_format=output_format), doc_loader
+    elif benchmark == "hotel_generate_document":
+        faker_instance = faker.Faker()
+
+        def generate_hotels(count):
+            documents = []
+            for _ in range(count):
+                hotel = template.Hotel(faker_instance)
+                hotel.generate_document(faker_instance, document_size)
+                documents.append(hotel.to_dict())
+            return documents
+        return generate_hotels, doc_loader
+    elif benchmark == "s3_generate_data":
+        s3_operations = s3Operations()
+        return lambda count: [s3_operations._generate_data(document_size) for _ in range(count)], doc_loader
+    raise ValueError(f"Unknown benchmark {benchmark}, expected one of {BENCHMARKS}")
+
+
+def run_case(benchmark, document_size, num_docs, generation_mode="faker", threads=1, processes=0,
+             output_format=None):
+    """
+    Run one benchmark case in the calling process
+    :return: dictionary with the case and its docs/sec, bytes/sec and peak RSS
+    """
+    generate, doc_loader = _generator(benchmark, document_size, generation_mode, threads, processes,
+                                      output_format)
+    try:
+        # builds vocabularies, padding buffer and generator processes outside of the measurement
+        generate(max(1, processes))
+        start = time.perf_counter()
+        documents = generate(num_docs)
+        seconds = time.perf_counter() - start
+    finally:
+        doc_loader.shutdown_generator_pool()
+    total_bytes = sum(encoded_document_size(document, output_format) for document in documents)
+    return {
+        "benchmark": benchmark,
+        "document_size": document_size,
+        "generation_mode": generation_mode,
+        "threads": threads,
+        "processes": processes,
+        "format": output_format or "dict",
+        "docs": len(documents),
+        "seconds": seconds,
+        "docs_per_sec": len(documents) / seconds,
+        "bytes_per_sec": total_bytes / seconds,
+        "peak_rss_kb": peak_rss_kb(resource.RUSAGE_SELF) if resource else None,
+        "peak_child_rss_kb": peak_rss_kb(resource.RUSAGE_CHILDREN) if resource else None
+    }
+
+
+def benchmark_cases(benchmarks, sizes, generation_modes, thread_counts, process_counts, formats):
+    """
+    Cases of the suite, only the dimensions that apply to each benchmark are varied
+    :return: list of keyword arguments of run_case, without num_docs
+    """
+    cases = []
+    for benchmark in benchmarks:
+        for document_size in sizes:
+            if benchmark in ("hotel_generate_document", "s3_generate_data"):
+                cases.append(dict(benchmark=benchmark, document_size=document_size))
+                continue
+            for generation_mode in generation_modes:
+                if benchmark == "generate_docs":
+                    cases.append(dict(benchmark=benchmark, document_size=document_size,
+                                      generation_mode=generation_mode))
+                elif benchmark == "generate_fake_documents_concurrently":
+                    for threads in thread_counts:
+                        cases.append(dict(benchmark=benchmark, document_size=document_size,
+                                          generation_mode=generation_mode, threads=threads))
+                    for processes in process_counts:
+                        if processes:
+                            cases.append(dict(benchmark=benchmark, document_size=document_size,
+                                              generation_mode=generation_mode, processes=processes))
+                else:
+                    for output_format in formats:
+                        cases.append(dict(benchmark=benchmark, document_size=document_size,
+                                          generation_mode=generation_mode, output_format=output_format))
+    return cases
+
+
+def run_suite(benchmarks=BENCHMARKS, sizes=DOCUMENT_SIZES, generation_modes=GENERATION_MODES,
+              thread_counts=THREAD_COUNTS, process_counts=PROCESS_COUNTS, formats=FORMATS,
+              max_docs=1000, bytes_per_case=16 * 1024 * 1024):
+    """
+    Run every case of the suite, each one in a fresh process
+    :param max_docs: largest number of documents generated by a case
+    :param bytes_per_case: cases generate about this many bytes, at least 3 documents
+    :return: dictionary with the environment and the list of results
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for case in benchmark_cases(benchmarks, sizes, generation_modes, thread_counts, process_counts, formats):
+        num_docs = max(3, min(max_docs, bytes_per_case // case["document_size"]))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                result = executor.submit(run_case, num_docs=num_docs, **case).result()
+            except Exception as err:
+                result = dict(case, error=str(err))
+        logging.info(json.dumps(result))
+        results.append(result)
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.time()
+        },
+        "results": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document generation")
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--sizes", nargs="+", type=int, default=DOCUMENT_SIZES)
+    parser.add_argument("--generation-modes", nargs="+", choices=GENERATION_MODES, default=GENERATION_MODES)
+    parser.add_argument("--threads", nargs="+", type=int, default=THREAD_COUNTS)
+    parser.add_argument("--processes", nargs="+", type=int, default=PROCESS_COUNTS)
+    parser.add_argument("--formats", nargs="+", choices=("dict",) + wire_format.WIRE_FORMATS,
+                        default=["dict"] + list(wire_format.WIRE_FORMATS))
+    parser.add_argument("--max-docs", type=int, default=1000)
+    parser.add_argument("--bytes-per-case", type=int, default=16 * 1024 * 1024)
+    parser.add_argument("--output", help="file to write the JSON results to, printed if not set")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    formats = [None if output_format == "dict" else output_format for output_format in args.formats]
+    report = run_suite(args.benchmarks, args.sizes, args.generation_modes, args.threads, args.processes,
+                       formats, args.max_docs, args.bytes_per_case)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,39 @@
 Docloader to create and upload document to various sources for goldFish
 Sources include mongoDB, dynamoDB, cassandra, etc.
 """
+import collections
 import concurrent
+import contextlib
 import concurrent.futures
 import faker
+import itertools
 import json
 import logging
+import marshal
+import multiprocessing
 import os
+import queue
 import random
 import string
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import uuid
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+from bson.objectid import ObjectId
+from pymongo import DeleteOne, InsertOne, UpdateOne
 
 import Docloader.docgen_template as template
+import Docloader.size_distribution as size_distribution
+import Docloader.template_registry as template_registry
+import Docloader.wire_format as wire_format
+from Docloader.docgen_vocabulary import VocabularyDocGenerator
+from Docloader.key_reservoir import KeyReservoir
+from Docloader.latency_recorder import LatencyRecorder
+from Docloader.rate_limiter import TokenBucket
+from SDKs.DynamoDB.dynamo_concurrency import AIMDConcurrencyController
 import SDKs.DynamoDB.dynamo_sdk as dynamoSdk
 from SDKs.DynamoDB.dynamo_sdk import DynamoDb
 from SDKs.MongoDB.MongoConfig import MongoConfig
@@ -24,6 +44,26 @@ from SDKs.s3.s3_SDK import s3SDK
 from SDKs.s3.s3_config import s3Config
 from SDKs.s3.s3_operations import s3Operations
 
+# DocLoader objects used by the generator processes, one per generation config
+_worker_doc_loaders = {}
+
+
+def generate_doc_batch_in_worker(document_size, generation_mode, batch_size, keys=None, seed=None, version=0,
+                                 output_format=None, template_name=template_registry.HOTEL_TEMPLATE,
+                                 document_size_distribution=None):
+    """
+    Generates a batch of documents inside a generator process
+    :return: the batch serialized with marshal, which is compact and fast to load for plain documents
+    """
+    config = (document_size, generation_mode, seed, template_name,
+              json.dumps(document_size_distribution, sort_keys=True))
+    if config not in _worker_doc_loaders:
+        _worker_doc_loaders[config] = DocLoader(document_size=document_size, generation_mode=generation_mode,
+                                                seed=seed, template=template_name,
+                                                document_size_distribution=document_size_distribution)
+    documents = _worker_doc_loaders[config].generate_doc_batch(batch_size, keys, version, output_format)
+    return marshal.dumps(wire_format.to_marshallable(documents, output_format))
+
 
 class DocLoader:
     """
@@ -32,11 +72,91 @@ class DocLoader:
     :params:
     -document_size: Default is 1024
     -no_of_docs: Default is 100
+    -generation_mode: "faker" builds every document with Faker, "vocabulary" samples batches
+    of documents from vocabularies pre-computed once per process. Default is "faker"
+    -num_generator_processes: if set, documents are generated in batches by a pool of
+    this many processes instead of threads. Default is 0
+    -seed: if set, the document with key N at mutation version V is a pure function of
+    (seed, N, V), see generate_docs. Only the loads write seeded documents, the CRUD workloads
+    update and delete random items with unseeded values, so only documents they did not touch
+    can be verified against get_expected_doc. Default is None
+    -pre_serialize: if set, the loaders have the generator encode documents to what is sent
+    to the source (BSON, dynamoDB attribute maps, mysql rows) and size them on that encoding.
+    Default is False
+    -template: name of the document template, "hotel" or any template of the template_registry.
+    generation_mode only applies to "hotel" documents. Default is "hotel"
+    -document_size_distribution: if set, document sizes are sampled from this distribution instead
+    of being document_size, see size_distribution.create_size_distribution for the spec. Default is None
     """
-
-    def __init__(self, document_size=1024, no_of_docs=100):
+    GENERATION_MODES = ("faker", "vocabulary")
+    # batches generated ahead of the consumer of iter_doc_batches
+    MAX_PENDING_BATCHES = 8
+    # largest batch streamed to loaders that write documents one by one
+    STREAM_BATCH_SIZE = 100
+    # relative weight of the operations of the dynamoDB CRUD workload
+    DYNAMO_OPERATION_MIX = {"insert": 0.35, "update": 0.3, "delete": 0.35}
+    # documents generated at once by each dynamoDB CRUD worker
+    DYNAMO_CRUD_DOC_BATCH = 25
+    # seconds between two recounts of the items by the dynamoDB CRUD workload
+    DYNAMO_RECOUNT_INTERVAL = 1200
+    # seconds between two logs of the CRUD workload stats
+    CRUD_STATS_INTERVAL = 60
+    # ways random documents are picked by the mongo CRUD, an aggregation $sample per operation,
+    # or an _id reservoir kept locally and refilled from _id only cursors
+    MONGO_RANDOM_SELECTIONS = ("sample", "reservoir")
+    # seconds between two reconciliations of the local document count of the mongo CRUD with the server
+    MONGO_RECOUNT_INTERVAL = 300
+    # _ids deleted per delete_many when shrinking a mongo collection
+    MONGO_DELETE_BATCH_SIZE = 1000
+
+    def __init__(self, document_size=1024, no_of_docs=100, generation_mode="faker", num_generator_processes=0,
+                 seed=None, pre_serialize=False, template=template_registry.HOTEL_TEMPLATE,
+                 document_size_distribution=None):
+        if generation_mode not in self.GENERATION_MODES:
+            raise ValueError(f"generation_mode must be one of {self.GENERATION_MODES}")
         self.document_size = document_size
+        self.document_size_distribution = document_size_distribution
+        self.size_distribution = size_distribution.create_size_distribution(
+            document_size_distribution or document_size)
         self.no_of_docs = no_of_docs
+        self.generation_mode = generation_mode
+        self.seed = seed
+        self.template = template
+        self.compiled_template = None
+        self.vocabulary_generator = None
+        if template != template_registry.HOTEL_TEMPLATE:
+            self.compiled_template = template_registry.get_template(template, seed)
+        elif generation_mode == "vocabulary":
+            self.vocabulary_generator = VocabularyDocGenerator(seed=seed)
+        # field filled to reach the document size, resized again by the wire formats
+        self.padding_field = self.compiled_template.padding_field if self.compiled_template else "padding"
+        # keys handed to seeded documents generated without an explicit key
+        self.key_counter = itertools.count()
+        self.num_generator_processes = num_generator_processes
+        self.generator_pool = None
+        self.pre_serialize = pre_serialize
+        # primary keys of dynamoDB items known to exist, random deletes and updates pick from it
+        self.dynamo_key_reservoir = KeyReservoir()
+        self.dynamo_batch_writer = None
+        self.dynamo_item_count = 0
+        self.dynamo_crud_stats = collections.Counter()
+        self.dynamo_rate_limiter = TokenBucket()
+        self.dynamo_concurrency_controller = AIMDConcurrencyController()
+        self.dynamo_read_rate_limiter = TokenBucket()
+        self.dynamo_read_latency = LatencyRecorder()
+        self.stats_lock = threading.Lock()
+        # MongoSDK of every mongo config used by the loader, their clients are released when it is stopped
+        # and no mongo worker uses them anymore
+        self.mongo_sdks = {}
+        self.active_mongo_workers = 0
+        # _ids of the documents known to exist in each mongo collection, random updates and deletes pick from it
+        self.mongo_id_reservoirs = collections.defaultdict(KeyReservoir)
+        self.mongo_random_selection = "reservoir"
+        self.mongo_crud_stats = collections.Counter()
+        # documents of each mongo collection, kept from the write results of the CRUD
+        self.mongo_doc_counts = collections.Counter()
+        # time of the last reconciliation of the document count of each mongo collection
+        self.mongo_last_recounts = collections.defaultdict(float)
         self.index = 0
         self.stop_mongo_loader = False
         self.stop_dynamo_loader = False
@@ -44,22 +164,6 @@ class DocLoader:
         self.stop_mysql_loader = False
         self.stop_dynamo_loader = False
 
-    def float_to_str(self, obj: any) -> any:
-        """
-        Change float values to str recursively in a given object.
-
-        :param obj: The input object to process.
-        :return: The modified object with float values converted to str.
-        """
-        if isinstance(obj, float):
-            return str(obj)
-        elif isinstance(obj, list):
-            return [self.float_to_str(item) for item in obj]
-        elif isinstance(obj, dict):
-            return {key: self.float_to_str(value) for key, value in obj.items()}
-        else:
-            return obj
-
     def calculate_optimal_batch_size(self, target_docs, current_docs, max_batch_size, upper_factor=0.1,
                                      lower_factor=0.01):
         """
@@ -103,9 +207,13 @@ class DocLoader:
              Stop the currently running loader.
 
              This method sets the `stop_loader` flag to True, indicating the loader to stop its operation.
+             The generator processes are stopped, they are started again on the next generation.
          """
+        self.shutdown_generator_pool(wait=False)
         if db == "mongo":
             self.stop_mongo_loader = True
+            # released now if no mongo worker runs, else by the last one to exit
+            self.release_mongo_clients()
         elif db == "s3":
             self.stop_s3_loader = True
         elif db == "mysql":
@@ -129,19 +237,254 @@ class DocLoader:
         elif db == "dynamo":
             self.stop_dynamo_loader = False
 
-    def generate_docs(self, index=None):
+    def next_keys(self, count):
+        """
+        Hands out the next keys for seeded documents generated without an explicit key
+        :param count: number of keys
+        :return: list of keys
+        """
+        return [next(self.key_counter) for _ in range(count)]
+
+    def sample_document_size(self, key=None, version=0):
+        """
+        Size of the next document, sampled from the size distribution of the loader.
+        For seeded loaders it is a function of (seed, key, version) like the rest of the document.
+        :param key: key of the document
+        :param version: mutation version of the document
+        :return: size in bytes
+        """
+        if self.size_distribution.fixed_size:
+            return self.size_distribution.fixed_size
+        if self.seed is not None:
+            return self.size_distribution.sample(random.Random(template.document_seed(self.seed, key, version)))
+        return self.size_distribution.sample(random)
+
+    def generate_docs(self, index=None, version=0):
         """
         Generates a single document
-        :param index: unused here
+        If the loader is seeded the document is a pure function of (seed, index, version),
+        so it can be regenerated instead of being read back from the source.
+        :param index: key of the document, the next key is used for seeded loaders if not given
+        :param version: mutation version of the document, only used by seeded loaders
         :return: a dictionary
         """
+        if self.seed is not None and index is None:
+            index = next(self.key_counter)
+        return self._generate_doc(index, version, self.sample_document_size(index, version))
+
+    def _generate_doc(self, index, version, document_size):
+        if self.seed is not None:
+            if self.compiled_template:
+                return self.compiled_template.generate(
+                    random.Random(template.document_seed(self.seed, index, version)), document_size, index)
+            if self.vocabulary_generator:
+                return self.vocabulary_generator.generate_seeded_batch(document_size, [index], version)[0]
+            doc_seed = template.document_seed(self.seed, index, version)
+            faker_instance = faker.Faker()
+            faker_instance.seed_instance(doc_seed)
+            hotel = template.Hotel(faker_instance)
+            hotel.mutated = float(version)
+            hotel.generate_document(faker_instance, document_size, index, random.Random(doc_seed),
+                                    template.SEEDED_REVIEW_END_DATE, template.SEEDED_REVIEW_START_DATE)
+            return hotel.to_dict()
+        if self.compiled_template:
+            return self.compiled_template.generate(random, document_size, index)
+        if self.vocabulary_generator:
+            return self.vocabulary_generator.generate_batch(1, document_size, [index])[0]
         faker_instance = faker.Faker()
         hotel = template.Hotel(faker_instance)
-        hotel.generate_document(faker_instance, self.document_size, index)
-        doc = json.loads(json.dumps(hotel, default=lambda o: o.__dict__))
+        hotel.generate_document(faker_instance, document_size, index)
+        doc = hotel.to_dict()
         del hotel, faker_instance
         return doc
 
+    def get_expected_doc(self, key, version=0):
+        """
+        Regenerates the document with the given key and mutation version, as it was sent to the source
+        :param key: key of the document
+        :param version: mutation version of the document
+        :return: a dictionary
+        """
+        if self.seed is None:
+            raise ValueError("DocLoader has to be created with a seed to regenerate documents")
+        return self.generate_docs(key, version)
+
+    def generate_doc_batch(self, batch_size, keys=None, version=0, output_format=None):
+        """
+        Generates a batch of documents on the calling thread
+        :param batch_size: number of documents
+        :param keys: optional list of keys, one for each document
+        :param version: mutation version of the documents, only used by seeded loaders
+        :param output_format: optional wire format from wire_format.WIRE_FORMATS to encode the documents to
+        :return: list of dictionaries, or of encoded documents
+        """
+        if self.seed is not None:
+            keys = keys or self.next_keys(batch_size)
+        document_sizes = [self.sample_document_size(keys[i] if keys else None, version) for i in range(batch_size)]
+        if self.seed is not None and self.vocabulary_generator:
+            documents = self.vocabulary_generator.generate_seeded_batch(document_sizes, keys, version)
+        elif self.vocabulary_generator:
+            documents = self.vocabulary_generator.generate_batch(batch_size, document_sizes, keys)
+        else:
+            documents = [self._generate_doc(keys[i] if keys else None, version, document_sizes[i])
+                         for i in range(batch_size)]
+        if output_format:
+            return wire_format.encode_batch(documents, output_format, document_sizes, self.padding_field)
+        return documents
+
+    def get_generator_pool(self):
+        """
+        Returns the process pool used for document generation, creating it on first use.
+        Processes are spawned, forked ones could inherit locks held by other threads of the loader
+        """
+        if not self.generator_pool:
+            self.generator_pool = ProcessPoolExecutor(max_workers=self.num_generator_processes,
+                                                      mp_context=multiprocessing.get_context("spawn"))
+        return self.generator_pool
+
+    def shutdown_generator_pool(self, wait=True):
+        """
+        Stops the generator processes, a new pool is created if documents are generated again
+        :param wait: wait for the submitted batches, else they are cancelled
+        """
+        generator_pool, self.generator_pool = self.generator_pool, None
+        if generator_pool:
+            generator_pool.shutdown(wait=wait, cancel_futures=not wait)
+
+    @contextlib.contextmanager
+    def generator_pool_scope(self):
+        """
+        Stops the generator processes at the end of the block, eg: of an initial load
+        """
+        try:
+            yield
+        finally:
+            self.shutdown_generator_pool()
+
+    def submit_doc_batch(self, batch_size, keys=None, version=0, output_format=None):
+        """
+        Submits the generation of a batch of documents to the generator processes
+        :return: future, its result has to be loaded with load_worker_batch
+        """
+        if self.seed is not None and not keys:
+            keys = self.next_keys(batch_size)
+        return self.get_generator_pool().submit(generate_doc_batch_in_worker, self.document_size,
+                                                self.generation_mode, batch_size, keys, self.seed, version,
+                                                output_format, self.template, self.document_size_distribution)
+
+    @staticmethod
+    def load_worker_batch(result, output_format=None):
+        """
+        Loads a batch sent back by a generator process
+        :param result: result of a future returned by submit_doc_batch
+        :param output_format: wire format the batch was submitted with
+        :return: list of documents
+        """
+        return wire_format.from_marshallable(marshal.loads(result), output_format)
+
+    def generate_docs_in_processes(self, batch_size, keys=None):
+        """
+        Generates documents by splitting them in one batch per generator process
+        :param batch_size: number of documents
+        :param keys: optional list of keys, one for each document
+        :return: list of dictionaries
+        """
+        if self.seed is not None and not keys:
+            keys = self.next_keys(batch_size)
+        chunk_size = max(1, -(-batch_size // self.num_generator_processes))
+        futures = [self.submit_doc_batch(min(chunk_size, batch_size - start),
+                                         keys[start:start + chunk_size] if keys else None)
+                   for start in range(0, batch_size, chunk_size)]
+        documents = []
+        for future in futures:
+            documents.extend(self.load_worker_batch(future.result()))
+        return documents
+
+    def measure_generation_scaling(self, num_docs=10000, process_counts=None):
+        """
+        Measures the document generation throughput for different numbers of generator processes
+        :param num_docs: number of documents generated for every process count
+        :param process_counts: process counts to measure. Default is 1, 2, 4 ... up to the number of cores
+        :return: dictionary of process count to docs/sec
+        """
+        if not process_counts:
+            process_counts = []
+            count = 1
+            while count < os.cpu_count():
+                process_counts.append(count)
+                count *= 2
+            process_counts.append(os.cpu_count())
+        configured_processes = self.num_generator_processes
+        scaling = {}
+        try:
+            for count in process_counts:
+                self.shutdown_generator_pool()
+                self.num_generator_processes = count
+                # warm up every process so pool start up is not measured
+                self.generate_docs_in_processes(count)
+                start = time.time()
+                self.generate_docs_in_processes(num_docs)
+                scaling[count] = num_docs / (time.time() - start)
+                logging.info(f"{count} generator processes on {os.cpu_count()} cores : "
+                             f"{scaling[count]:.0f} docs/sec")
+        finally:
+            self.shutdown_generator_pool()
+            self.num_generator_processes = configured_processes
+        return scaling
+
+    def iter_doc_batches(self, num_docs, batch_size, num_workers=4, max_pending_batches=None, start_key=None,
+                         output_format=None):
+        """
+        Generates documents as a stream of fixed size batches, the last one may be smaller.
+        At most max_pending_batches batches are generated ahead of the consumer, a new batch is
+        only started once the consumer takes one, so memory does not grow with num_docs.
+        :param num_docs: total number of documents
+        :param batch_size: number of documents per batch
+        :param num_workers: threads generating batches, ignored if generator processes are configured
+        :param max_pending_batches: Default is MAX_PENDING_BATCHES
+        :param start_key: if set, documents get consecutive keys starting from it.
+        Seeded loaders always use their next keys.
+        :param output_format: optional wire format from wire_format.WIRE_FORMATS to encode the documents to
+        :return: generator of lists of documents
+        """
+        max_pending_batches = max_pending_batches or self.MAX_PENDING_BATCHES
+        executor = None if self.num_generator_processes else ThreadPoolExecutor(num_workers)
+        batch_starts = iter(range(0, num_docs, batch_size))
+        pending = collections.deque()
+
+        def submit(batch_start):
+            count = min(batch_size, num_docs - batch_start)
+            if self.seed is not None:
+                keys = self.next_keys(count)
+            elif start_key is not None:
+                keys = list(range(start_key + batch_start, start_key + batch_start + count))
+            else:
+                keys = None
+            if executor:
+                return executor.submit(self.generate_doc_batch, count, keys, 0, output_format)
+            return self.submit_doc_batch(count, keys, 0, output_format)
+
+        try:
+            for batch_start in itertools.islice(batch_starts, max_pending_batches):
+                pending.append(submit(batch_start))
+            while pending:
+                future = pending.popleft()
+                next_start = next(batch_starts, None)
+                if next_start is not None:
+                    pending.append(submit(next_start))
+                try:
+                    result = future.result()
+                except Exception as err:
+                    print(f"An error occurred: {err}")
+                    continue
+                # generator processes return a whole serialized batch
+                yield self.load_worker_batch(result, output_format) if self.num_generator_processes else result
+        finally:
+            for future in pending:
+                future.cancel()
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
     def generate_fake_documents_concurrently(self, batch_size=25, num_workers=4):
         """
         Increase the document generation process
@@ -149,6 +492,11 @@ class DocLoader:
         :param num_workers: Default 4
         :return: list of documents
         """
+        if self.num_generator_processes:
+            return self.generate_docs_in_processes(batch_size)
+        if self.vocabulary_generator or self.compiled_template:
+            # batch generators are cheap enough that threads only add overhead
+            return self.generate_doc_batch(batch_size)
         documents = []
         with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
             future_to_doc = {executor.submit(self.generate_docs): _ for _ in range(batch_size)}
@@ -162,50 +510,88 @@ class DocLoader:
 
     # -- DYNAMODB --
     def load_doc_to_dynamo(self, access_key, secret_key, session_token=None, table=None, region_name=None,
-                           batch_size=1000, max_concurrent_batches=3, add_id_key=False):
+                           batch_size=1000, max_concurrent_batches=3, add_id_key=False, num_writer_threads=32,
+                           p_key=None):
         """
         :param table: dynamoDb table name
         :param batch_size:
         :param max_concurrent_batches:
         :param region_name: Region in which dynamodb table is deployed
         Either region or url is required, table name is required if table already exist
+        :param num_writer_threads: highest number of 25 item BatchWriteItem calls in flight, the writer
+        raises its concurrency up to it until dynamoDB throttles, see get_dynamo_write_stats
+        :param p_key: primary key attribute, if set the keys written are added to the key reservoir
         """
         start = time.time()
         dynamo_obj = dynamoSdk.DynamoDb(access_key=access_key, secret_key=secret_key, session_token=session_token,
-                                        table=table, region=region_name)
-        with concurrent.futures.ThreadPoolExecutor(max_concurrent_batches) as executor:
-            futures = []
-            for i in range(0, self.no_of_docs, batch_size):
-                batch_start = i
-                batch_end = min(i + batch_size, self.no_of_docs)
-                futures.extend(executor.submit(self.generate_docs, index)
-                               for index in range(batch_start, batch_end))
-
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    document = future.result()
-                    if document:
-                        # converting float to str for dynamoDB
-                        # does not support float type
-                        for key in document:
-                            document[key] = self.float_to_str(document[key])
-
-                        # Maintaining the size of the document after converting float to str.
-                        if len(str(document).encode("utf-8")) > 1024:
-                            padding_size = max(len(str(document).encode("utf-8")) -
-                                               self.document_size, 0)
-                            document['padding'] = document['padding'][:-padding_size]
-
-                        # if you want id field
-                        if add_id_key:
-                            document['id'] = str(uuid.uuid4())
-                        dynamo_obj.write_batch([document])  # Write each document separately
-                except Exception as err:
-                    print(f"An error occurred: {err}")
+                                        table=table, region=region_name, max_pool_connections=num_writer_threads)
+        # documents are queued one by one, so generate them in small batches to start writing early
+        output_format = "dynamodb" if self.pre_serialize else wire_format.SIZED
+        with dynamo_obj.get_batch_writer(num_threads=num_writer_threads) as batch_writer:
+            self.dynamo_batch_writer = batch_writer
+            for documents in self.iter_doc_batches(self.no_of_docs, min(batch_size, self.STREAM_BATCH_SIZE),
+                                                   num_workers=max_concurrent_batches, start_key=0,
+                                                   output_format=output_format):
+                for document in documents:
+                    # documents which are not pre-serialized come with the size drawn for them
+                    document, document_size = (document, None) if self.pre_serialize else document
+                    self._write_doc_to_dynamo(batch_writer, document, add_id_key, p_key, document_size)
 
         end = time.time()
         time_spent = end - start
-        logging.info(f"Took {time_spent} to insert docs")
+        logging.info(f"Took {time_spent} to insert docs, {batch_writer.stats()}")
+
+    def get_dynamo_write_stats(self):
+        """
+        Stats of the batch writer of the last dynamoDB load: items written, items/sec,
+        current concurrency and throttle rate
+        :return: dictionary, empty if nothing was loaded to dynamoDB
+        """
+        return self.dynamo_batch_writer.stats() if self.dynamo_batch_writer else {}
+
+    def _to_dynamo_item(self, document, add_id_key=False, document_size=None):
+        """
+        Converts a generated document to the item written to dynamoDB
+        :param document: generated document, or its dynamoDB attribute map if the loader pre-serializes
+        :param add_id_key: add a uuid 'id' field to the document
+        :param document_size: size drawn for the document. Default is the document_size of the loader
+        :return: the item, as an attribute map if the loader pre-serializes
+        """
+        if self.pre_serialize:
+            # the padding gives up the size of the id, the item was sized when it was serialized
+            if add_id_key:
+                wire_format.add_to_dynamodb_item(document, 'id', str(uuid.uuid4()), self.padding_field)
+            return document
+        # if you want id field, added first so it counts in the document size
+        if add_id_key:
+            document['id'] = str(uuid.uuid4())
+        # dynamoDB does not support the float type, floats are converted to Decimal
+        # and the padding is resized on the item size dynamoDB accounts for
+        return wire_format.to_dynamodb_document(document, document_size or self.document_size, self.padding_field)
+
+    def _dynamo_key_value(self, item, p_key):
+        """
+        :return: value of the primary key of an item returned by _to_dynamo_item
+        """
+        return TypeDeserializer().deserialize(item[p_key]) if self.pre_serialize else item[p_key]
+
+    def _write_doc_to_dynamo(self, batch_writer, document, add_id_key=False, p_key=None, document_size=None):
+        """
+        Queues a generated document to be written to dynamoDB
+        :param batch_writer: object of class DynamoBatchWriter
+        :param document: generated document, or its dynamoDB attribute map if the loader pre-serializes
+        :param add_id_key: add a uuid 'id' field to the document
+        :param p_key: primary key attribute, its value is added to the key reservoir
+        :param document_size: size drawn for the document, if it is not pre-serialized
+        """
+        try:
+            if document:
+                item = self._to_dynamo_item(document, add_id_key, document_size)
+                batch_writer.put_item(item, serialized=self.pre_serialize)
+                if p_key in item:
+                    self.dynamo_key_reservoir.add(self._dynamo_key_value(item, p_key))
+        except Exception as err:
+            print(f"An error occurred: {err}")
 
     def delete_from_dynamodb(self, access_key, secret_key, item_key, session_token=None, table=None, region_name=None,
                              condition_expression=None,
@@ -240,51 +626,109 @@ class DocLoader:
                                         table=table, region=region_name)
         dynamo_obj.update_item(item_key, changed_object_json)
 
+    def random_dynamo_key(self, dynamo_obj, p_key, remove=False):
+        """
+        Picks the key of a random item from the key reservoir, which is refilled with a parallel scan
+        of the table when it is empty or stale
+        :param dynamo_obj: object of class DynamoDb
+        :param p_key: primary key attribute
+        :param remove: remove the key from the reservoir, for deletes
+        :return: value of the primary key, None if the table is empty
+        """
+        self.dynamo_key_reservoir.refresh_if_needed(lambda: dynamo_obj.scan_key_values(p_key))
+        return self.dynamo_key_reservoir.pop() if remove else self.dynamo_key_reservoir.pick()
+
     def delete_random_in_dynamodb(self, access_key, secret_key, p_key, session_token=None, table=None,
                                   region_name=None):
         dynamo_obj = dynamoSdk.DynamoDb(access_key=access_key, secret_key=secret_key, session_token=session_token,
                                         table=table, region=region_name)
-        expression_attribute_names = {'#key_attr': p_key}
-        response = dynamo_obj.scan_table(projection_expression='#key_attr',
-                                         expression_attribute_names=expression_attribute_names)
+        key = self.random_dynamo_key(dynamo_obj, p_key, remove=True)
 
-        if len(response) > 0:
-            random_item = random.choice(response)
+        if key is not None:
             try:
-                self.delete_from_dynamodb(access_key=access_key, secret_key=secret_key, session_token=session_token,
-                                          table=table, region_name=region_name,
-                                          item_key={p_key: random_item[p_key]})
+                dynamo_obj.delete_item(item_key={p_key: key})
                 print("Document deleted successfully")
             except Exception as e:
                 logging.info(f"Error : {str(e)}")
 
+    def shrink_dynamo_table(self, dynamo_obj, p_key, num_items, num_writer_threads=32, max_attempts=5):
+        """
+        Deletes num_items items with a parallel key scan and batched DeleteRequests,
+        the scan stops as soon as enough keys are collected. Deletes which failed are made up for
+        by scanning again for the missing number of items, up to max_attempts scans.
+        :param dynamo_obj: object of class DynamoDb
+        :param p_key: primary key attribute
+        :param num_items: number of items to delete
+        :param num_writer_threads: highest number of 25 item BatchWriteItem calls in flight
+        :param max_attempts: largest number of scans
+        :return: number of items deleted
+        """
+        start = time.time()
+        deleted = 0
+        for _ in range(max_attempts):
+            shortfall = num_items - deleted
+            if shortfall <= 0:
+                break
+            with dynamo_obj.get_batch_writer(num_threads=num_writer_threads, key_attributes=(p_key,)) as batch_writer:
+                # consistent so the items deleted by the previous attempts are not scanned again
+                for key in itertools.islice(dynamo_obj.scan_key_values(p_key, consistent_read=True), shortfall):
+                    batch_writer.delete_item({p_key: key})
+                    self.dynamo_key_reservoir.remove(key)
+            stats = batch_writer.stats()
+            deleted += stats['items_written']
+            if stats['items_written'] == 0:
+                break
+            if stats['items_failed']:
+                logging.info(f"{stats['items_failed']} deletes failed, scanning again for them")
+        logging.info(f"Deleted {deleted} of {num_items} items in {time.time() - start} sec")
+        return deleted
+
     def setup_inital_load_on_dynamo_db(self, access_key, secret_key, region_name, p_key, initial_doc_count, table,
                                        session_token=None, add_id_key=False):
 
         dynamo_object = DynamoDb(access_key=access_key, secret_key=secret_key, session_token=session_token,
                                  table=table, region=region_name)
 
-        initial_doc_count = int(initial_doc_count)
-        current_docs = int(dynamo_object.get_live_item_count())
-        while current_docs < initial_doc_count:
-            batch_size = self.calculate_optimal_batch_size(initial_doc_count, current_docs, 10000)
-            self.no_of_docs = initial_doc_count - current_docs
-            self.load_doc_to_dynamo(access_key=access_key, secret_key=secret_key,
-                                    session_token=session_token, table=table, region_name=region_name,
-                                    batch_size=batch_size, add_id_key=add_id_key)
+        with self.generator_pool_scope():
+            initial_doc_count = int(initial_doc_count)
             current_docs = int(dynamo_object.get_live_item_count())
-        self.no_of_docs = 1
-        while current_docs > initial_doc_count:
-            self.delete_random_in_dynamodb(access_key=access_key, secret_key=secret_key,
-                                           session_token=session_token, region_name=region_name,
-                                           p_key=p_key, table=table)
-            current_docs -= 1
+            while current_docs < initial_doc_count:
+                batch_size = self.calculate_optimal_batch_size(initial_doc_count, current_docs, 10000)
+                self.no_of_docs = initial_doc_count - current_docs
+                self.load_doc_to_dynamo(access_key=access_key, secret_key=secret_key,
+                                        session_token=session_token, table=table, region_name=region_name,
+                                        batch_size=batch_size, add_id_key=add_id_key, p_key=p_key)
+                current_docs = int(dynamo_object.get_live_item_count())
+            self.no_of_docs = 1
+            while current_docs > initial_doc_count:
+                deleted = self.shrink_dynamo_table(dynamo_object, p_key, current_docs - initial_doc_count)
+                current_docs = int(dynamo_object.get_live_item_count())
+                if not deleted:
+                    logging.error(f"Could not shrink table {table} to {initial_doc_count} items, {current_docs} left")
+                    break
 
     def perform_crud_on_dynamodb(self, access_key, secret_key, region_name, p_key, session_token=None, table=None,
-                                 num_buffer=0, add_id_key=False):
+                                 num_buffer=0, add_id_key=False, ops_per_sec=None, num_workers=4, operation_mix=None,
+                                 read_workers=0, reads_per_sec=None, keys_per_read=100, query_ratio=0.0):
+        """
+        Runs inserts, updates and deletes of random items on num_workers threads until the loader is stopped,
+        see get_dynamo_crud_stats. Reads of random items run alongside on read_workers threads,
+        see get_dynamo_read_stats
+        :param num_buffer: the item count is kept within num_buffer of the count at start, 0 for no bound
+        :param ops_per_sec: target operations per second of all the workers together, None for no limit
+        :param num_workers: threads running operations, 0 for a read only workload
+        :param operation_mix: relative weight of each operation, eg: {"insert": 2, "update": 1, "delete": 2}.
+        Default is DYNAMO_OPERATION_MIX
+        :param read_workers: threads running reads, 0 for no reads
+        :param reads_per_sec: target read calls per second of all the read workers together, None for no limit
+        :param keys_per_read: keys of each BatchGetItem call, at most 100
+        :param query_ratio: fraction of the read calls that are a Query on the key of a random item
+        instead of a BatchGetItem
+        """
         try:
             dynamo_object = DynamoDb(access_key=access_key, secret_key=secret_key, session_token=session_token,
-                                     table=table, region=region_name)
+                                     table=table, region=region_name,
+                                     max_pool_connections=num_workers + read_workers)
 
             start_docs = dynamo_object.get_live_item_count()
             if num_buffer == 0:
@@ -293,53 +737,292 @@ class DocLoader:
             else:
                 max_files = start_docs + num_buffer
                 min_files = max(int(start_docs - num_buffer), 0)
+            self.dynamo_item_count = start_docs
+            self.dynamo_crud_stats = collections.Counter()
+            self.dynamo_rate_limiter = TokenBucket(ops_per_sec)
+            self.dynamo_concurrency_controller = AIMDConcurrencyController(
+                initial_concurrency=min(4, max(num_workers, 1)), max_concurrency=max(num_workers, 1))
+            # writes are not retried by botocore, so the concurrency controller sees the throttling
+            dynamo_writer = DynamoDb(access_key=access_key, secret_key=secret_key, session_token=session_token,
+                                     table=table, region=region_name, max_pool_connections=num_workers,
+                                     max_attempts=1)
+            operation_mix = operation_mix or self.DYNAMO_OPERATION_MIX
+            for _ in range(num_workers):
+                threading.Thread(target=self._dynamo_crud_worker, daemon=True,
+                                 args=(dynamo_object, dynamo_writer, p_key, add_id_key, min_files, max_files,
+                                       list(operation_mix), list(operation_mix.values()))).start()
+            self.dynamo_read_rate_limiter = TokenBucket(reads_per_sec)
+            self.dynamo_read_latency = LatencyRecorder()
+            keys_per_read = min(keys_per_read, DynamoDb.MAX_BATCH_GET_SIZE)
+            for _ in range(read_workers):
+                threading.Thread(target=self._dynamo_read_worker, daemon=True,
+                                 args=(dynamo_object, p_key, keys_per_read, query_ratio)).start()
             last_update_time = time.time()
             while True:
-                while not self.stop_dynamo_loader:
-                    current_docs = start_docs
-                    current_time = time.time()
-                    if current_time - last_update_time >= 1200:
-                        current_docs = dynamo_object.get_live_item_count()
-                        last_update_time = current_time
-                    operation = random.choice(["insert", "delete"])
-                    if operation == "insert" and current_docs < max_files:
-                        self.load_doc_to_dynamo(access_key=access_key, secret_key=secret_key,
-                                                session_token=session_token, table=table, region_name=region_name,
-                                                batch_size=1, add_id_key=add_id_key)
-                        print('document inserted successfully')
-                    elif operation == "delete" and current_docs > min_files:
-                        self.delete_random_in_dynamodb(access_key=access_key, secret_key=secret_key,
-                                                       session_token=session_token, region_name=region_name,
-                                                       p_key=p_key, table=table)
+                time.sleep(self.CRUD_STATS_INTERVAL)
+                if self.stop_dynamo_loader:
+                    continue
+                logging.info(f"CRUD on dynamoDB table {table}: {self.get_dynamo_crud_stats()}")
+                if read_workers:
+                    logging.info(f"Reads on dynamoDB table {table}: {self.get_dynamo_read_stats()}")
+                if time.time() - last_update_time >= self.DYNAMO_RECOUNT_INTERVAL:
+                    self.dynamo_item_count = dynamo_object.get_live_item_count()
+                    last_update_time = time.time()
         except Exception as e:
             raise Exception(e)
 
+    def _dynamo_crud_worker(self, dynamo_obj, dynamo_writer, p_key, add_id_key, min_items, max_items, operations,
+                            weights):
+        """
+        Runs CRUD operations on the table, paced by the shared rate limiter.
+        Scans go through dynamo_obj, writes through dynamo_writer and the shared concurrency controller.
+        """
+        documents = []
+        while True:
+            if self.stop_dynamo_loader:
+                time.sleep(1)
+                continue
+            self.dynamo_rate_limiter.acquire()
+            operation = random.choices(operations, weights)[0]
+            try:
+                if not documents:
+                    documents = self.generate_doc_batch(self.DYNAMO_CRUD_DOC_BATCH, output_format=wire_format.SIZED)
+                if operation == "insert" and self.dynamo_item_count < max_items:
+                    document, document_size = documents.pop()
+                    if self.pre_serialize:
+                        document = wire_format.to_dynamodb_item(document, document_size, self.padding_field)
+                    item = self._to_dynamo_item(document, add_id_key, document_size)
+                    if self.pre_serialize:
+                        self._controlled_dynamo_write(dynamo_writer.add_serialized_item, item)
+                    else:
+                        self._controlled_dynamo_write(dynamo_writer.add_item, item)
+                    if p_key in item:
+                        self.dynamo_key_reservoir.add(self._dynamo_key_value(item, p_key))
+                    self._record_dynamo_operation(operation, 1)
+                elif operation == "update":
+                    key = self.random_dynamo_key(dynamo_obj, p_key)
+                    if key is not None:
+                        update = self._random_dynamo_update(documents.pop()[0], p_key, self.padding_field)
+                        self._controlled_dynamo_write(dynamo_writer.update_item, {p_key: key}, update)
+                        self._record_dynamo_operation(operation)
+                elif operation == "delete" and self.dynamo_item_count > min_items:
+                    key = self.random_dynamo_key(dynamo_obj, p_key, remove=True)
+                    if key is not None:
+                        self._controlled_dynamo_write(dynamo_writer.delete_item, item_key={p_key: key})
+                        self._record_dynamo_operation(operation, -1)
+            except Exception as e:
+                self._record_dynamo_operation("failed")
+                logging.info(f"Error : {str(e)}")
+
+    def _controlled_dynamo_write(self, write, *args, max_retries=10, **kwargs):
+        """
+        Runs a write of the CRUD workload within the limit of the concurrency controller,
+        throttled writes lower the limit and are retried with jittered exponential backoff
+        """
+        attempt = 0
+        while True:
+            throttled = False
+            self.dynamo_concurrency_controller.acquire()
+            try:
+                return write(*args, **kwargs)
+            except ClientError as err:
+                throttled = AIMDConcurrencyController.is_throttling_error(err)
+                if not throttled or attempt >= max_retries:
+                    raise
+            finally:
+                self.dynamo_concurrency_controller.release(throttled)
+            attempt += 1
+            time.sleep(random.uniform(0, min(5, 0.05 * 2 ** attempt)))
+
+    def _dynamo_read_worker(self, dynamo_obj, p_key, keys_per_read, query_ratio):
+        """
+        Reads random items with BatchGetItem or Query calls, paced by the shared read rate limiter,
+        and records the latency of every call
+        """
+        while True:
+            if self.stop_dynamo_loader:
+                time.sleep(1)
+                continue
+            self.dynamo_read_rate_limiter.acquire()
+            try:
+                self.dynamo_key_reservoir.refresh_if_needed(lambda: dynamo_obj.scan_key_values(p_key))
+                operation = "query" if random.random() < query_ratio else "batch_get"
+                keys = self.dynamo_key_reservoir.sample(1 if operation == "query" else keys_per_read)
+                if not keys:
+                    time.sleep(1)
+                    continue
+                start = time.perf_counter()
+                if operation == "query":
+                    items = dynamo_obj.query_table(Key(p_key).eq(keys[0]))
+                else:
+                    items = dynamo_obj.batch_get_items([{p_key: key} for key in keys])
+                self.dynamo_read_latency.record(time.perf_counter() - start)
+                with self.stats_lock:
+                    self.dynamo_crud_stats[operation] += 1
+                    self.dynamo_crud_stats["items_read"] += len(items)
+            except Exception as e:
+                self._record_dynamo_operation("failed_read")
+                logging.info(f"Error : {str(e)}")
+
+    def get_dynamo_crud_stats(self):
+        """
+        Stats of the write workload of the dynamoDB CRUD: operations run, items in the table and the
+        current concurrency and throttle rate of its concurrency controller
+        :return: dictionary
+        """
+        with self.stats_lock:
+            stats = {operation: self.dynamo_crud_stats[operation]
+                     for operation in ("insert", "update", "delete", "failed")}
+            stats["items"] = self.dynamo_item_count
+        stats.update(self.dynamo_concurrency_controller.stats())
+        return stats
+
+    def get_dynamo_read_stats(self):
+        """
+        Stats of the read workload of the dynamoDB CRUD: calls, items read and latency percentiles
+        :return: dictionary
+        """
+        stats = self.dynamo_read_latency.summary()
+        with self.stats_lock:
+            for operation in ("batch_get", "query", "items_read", "failed_read"):
+                stats[operation] = self.dynamo_crud_stats[operation]
+        return stats
+
+    def _record_dynamo_operation(self, operation, item_count_change=0):
+        with self.stats_lock:
+            self.dynamo_crud_stats[operation] += 1
+            self.dynamo_item_count += item_count_change
+
+    @staticmethod
+    def _random_dynamo_update(document, p_key, padding_field="padding", max_attributes=3):
+        """
+        Picks a few attributes of a generated document to set on an existing item, never its padding
+        :return: dictionary of attribute to value, floats converted to Decimal
+        """
+        attributes = [attribute for attribute in document if attribute not in (p_key, padding_field)]
+        attributes = random.sample(attributes, random.randint(1, min(max_attributes, len(attributes))))
+        return {attribute: wire_format.to_dynamodb_number(document[attribute]) for attribute in attributes}
+
     # -- MONGODB --
-    def load_doc_to_mongo(self, mongoConfig, collection_name, num_docs, batch_size):
+    def get_mongo_sdk(self, mongo_config):
+        """
+            MongoSDK of the loader for a config, created on first use.
+            Its MongoClient is shared with the rest of the process and released when the mongo loader is stopped.
+
+            :param mongo_config: MongoDB configuration -> object of class MongoConfig
+        """
+        key = (getattr(mongo_config, "atlas_url", None), mongo_config.mongo_ip, mongo_config.port,
+               mongo_config.username, mongo_config.password, mongo_config.database_name)
+        with self.stats_lock:
+            if key not in self.mongo_sdks:
+                self.mongo_sdks[key] = MongoSDK(mongo_config)
+            return self.mongo_sdks[key]
+
+    def release_mongo_clients(self):
+        """
+            Release the MongoClients used by the loader, they are acquired again if the loader is restarted.
+            Nothing is released while a mongo worker runs, the last worker to exit releases them.
+        """
+        with self.stats_lock:
+            if self.active_mongo_workers:
+                return
+            mongo_sdks, self.mongo_sdks = list(self.mongo_sdks.values()), {}
+        for mongo_sdk in mongo_sdks:
+            mongo_sdk.close_mongoDB_connection()
+
+    @contextlib.contextmanager
+    def mongo_worker(self):
+        """
+            Keep the MongoClients of the loader open while the block runs, they are released at its end
+            if the loader was stopped meanwhile.
+        """
+        with self.stats_lock:
+            self.active_mongo_workers += 1
+        try:
+            yield
+        finally:
+            with self.stats_lock:
+                self.active_mongo_workers -= 1
+            if self.stop_mongo_loader:
+                self.release_mongo_clients()
+
+    def load_doc_to_mongo(self, mongoConfig, collection_name, num_docs, batch_size, num_generators=4, num_writers=8,
+                          max_queued_batches=None):
         """
             Insert documents into the MongoDB collection.
+            Batches are generated by num_generators threads into a bounded queue and inserted by num_writers
+            threads with insert_many. Generators block while the queue is full, so memory stays bounded
+            whichever side is slower.
 
             :param mongoConfig: MongoDB configuration -> object of class MongoConfig
             :param collection_name: Name of the collection to insert documents into
             :param num_docs: Total number of documents to insert
             :param batch_size: Number of documents to insert per batch.
+            :param num_generators: threads generating batches, they wait on the generator processes if configured
+            :param num_writers: threads inserting batches
+            :param max_queued_batches: batches generated ahead of the writers. Default is twice num_writers
+            :return: dictionary with the documents inserted, docs/sec and the generation and write utilization,
+            the fraction of the time the generators spent generating and the writers spent inserting
         """
-        mongo_obj = MongoSDK(mongoConfig)
-
-        total_documents = num_docs
-        batch_size = batch_size
-        max_concurrent_batches = 500
-        start = time.time()
-        with concurrent.futures.ThreadPoolExecutor(max_concurrent_batches) as executor:
-            for i in range(0, total_documents, batch_size):
-                batch_start = i
-                batch_end = min(i + batch_size, total_documents)
-                data_to_insert = self.generate_fake_documents_concurrently(
-                    batch_end - batch_start)
-                if data_to_insert:
-                    executor.submit(mongo_obj.insert_multiple_document, collection_name, data_to_insert)
-        end = time.time()
-        logging.info(f"Took {end - start} to insert docs")
+        with self.mongo_worker():
+            mongo_obj = self.get_mongo_sdk(mongoConfig)
+            output_format = "bson" if self.pre_serialize else None
+            batches = queue.Queue(max_queued_batches or 2 * num_writers)
+            batch_starts = iter(range(0, num_docs, batch_size))
+            pipeline_lock = threading.Lock()
+            busy_time = collections.Counter()
+
+            def generate():
+                while True:
+                    with pipeline_lock:
+                        batch_start = next(batch_starts, None)
+                        if batch_start is None:
+                            return
+                        count = min(batch_size, num_docs - batch_start)
+                        keys = self.next_keys(count) if self.seed is not None else None
+                    started = time.perf_counter()
+                    try:
+                        if self.num_generator_processes:
+                            documents = self.load_worker_batch(
+                                self.submit_doc_batch(count, keys, 0, output_format).result(), output_format)
+                        else:
+                            documents = self.generate_doc_batch(count, keys, 0, output_format)
+                    except Exception as err:
+                        print(f"An error occurred: {err}")
+                        continue
+                    with pipeline_lock:
+                        busy_time["generation"] += time.perf_counter() - started
+                    batches.put(documents)
+
+            def write():
+                while True:
+                    documents = batches.get()
+                    if documents is None:
+                        return
+                    started = time.perf_counter()
+                    inserted = mongo_obj.insert_multiple_document(collection_name, documents)
+                    with pipeline_lock:
+                        busy_time["write"] += time.perf_counter() - started
+                        busy_time["inserted"] += inserted
+
+            start = time.perf_counter()
+            generators = [threading.Thread(target=generate, daemon=True) for _ in range(num_generators)]
+            writers = [threading.Thread(target=write, daemon=True) for _ in range(num_writers)]
+            for thread in generators + writers:
+                thread.start()
+            for thread in generators:
+                thread.join()
+            for _ in writers:
+                batches.put(None)
+            for thread in writers:
+                thread.join()
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            stats = {"inserted": busy_time["inserted"], "seconds": round(elapsed, 3),
+                     "docs_per_sec": round(busy_time["inserted"] / elapsed, 1),
+                     "generation_utilization": round(busy_time["generation"] / (num_generators * elapsed), 3),
+                     "write_utilization": round(busy_time["write"] / (num_writers * elapsed), 3)}
+            logging.info(f"Took {elapsed} to insert docs, {stats}")
+            return stats
 
     def update_in_mongo(self, mongo_config, collection_name, update_from, update_to):
         """
@@ -349,8 +1032,9 @@ class DocLoader:
             :param update_from: The query used to filter documents to be updated
             :param update_to: The update operation to apply to matching documents.
         """
-        mongo_obj = MongoSDK(mongo_config)
-        mongo_obj.update_document(collection_name, update_from, update_to)
+        with self.mongo_worker():
+            mongo_obj = self.get_mongo_sdk(mongo_config)
+            mongo_obj.update_document(collection_name, update_from, update_to)
 
     def delete_from_mongo(self, mongo_config, collection_name, delete_query):
         """
@@ -359,8 +1043,9 @@ class DocLoader:
             :param collection_name: Name of the collection to delete documents from
             :param delete_query: The query used to filter and delete documents.
         """
-        mongo_obj = MongoSDK(mongo_config)
-        mongo_obj.delete_document(collection_name, delete_query)
+        with self.mongo_worker():
+            mongo_obj = self.get_mongo_sdk(mongo_config)
+            mongo_obj.delete_document(collection_name, delete_query)
 
     def perform_random_update(self, mongo_config, collection_name):
         """
@@ -370,11 +1055,11 @@ class DocLoader:
             - mongo_config : Object of class SDKs.MongoDB.MongoConfig
             - collection_name (str): The name of the MongoDB collection to perform the update on.
         """
-        mongo_obj = MongoSDK(mongo_config)
-        random_doc = mongo_obj.get_random_doc(collection_name)
-        if random_doc:
+        mongo_obj = self.get_mongo_sdk(mongo_config)
+        random_id = self.random_mongo_id(mongo_obj, collection_name)
+        if random_id is not None:
             updated_doc = self.generate_docs()
-            updated_doc["_id"] = random_doc["_id"]
+            updated_doc["_id"] = random_id
 
             mongo_obj.update_document(collection_name, {"_id": updated_doc["_id"]}, updated_doc)
 
@@ -386,73 +1071,243 @@ class DocLoader:
             - mongo_config : Object of class SDKs.MongoDB.MongoConfig
             - collection_name (str): The name of the MongoDB collection to perform the deletion on.
         """
-        mongo_obj = MongoSDK(mongo_config)
-        total_documents = mongo_obj.get_current_doc_count(collection_name)
-        if total_documents == 0:
-            return
+        mongo_obj = self.get_mongo_sdk(mongo_config)
+        random_id = self.random_mongo_id(mongo_obj, collection_name, remove=True)
+        if random_id is None:
+            return 0
 
-        random_document = mongo_obj.get_random_doc(collection_name)
-        mongo_obj.delete_document(collection_name, {"_id": random_document["_id"]})
+        return mongo_obj.delete_document(collection_name, {"_id": random_id}).deleted_count
 
-    def setup_initial_load_on_mongo(self, mongo_config, collection_name, initial_doc_count):
+    def random_mongo_id(self, mongo_obj, collection_name, remove=False):
+        """
+            Pick the _id of a random document, with a $sample aggregation or from the _id reservoir of the
+            collection depending on mongo_random_selection. The reservoir is refilled with an _id only cursor
+            when it is empty or stale.
+
+            :param mongo_obj: object of class MongoSDK
+            :param collection_name: Name of the collection
+            :param remove: remove the _id from the reservoir, for deletes
+            :return: the _id, None if the collection is empty
+        """
+        reservoir = self.mongo_id_reservoirs[collection_name]
+        if self.mongo_random_selection == "sample":
+            random_doc = mongo_obj.get_random_doc(collection_name, {"_id": 1})
+            if random_doc is None:
+                return None
+            if remove:
+                reservoir.remove(random_doc["_id"])
+            return random_doc["_id"]
+        reservoir.refresh_if_needed(lambda: mongo_obj.iter_document_ids(collection_name))
+        return reservoir.pop() if remove else reservoir.pick()
+
+    def setup_initial_load_on_mongo(self, mongo_config, collection_name, initial_doc_count, num_generators=4,
+                                    num_writers=8):
         if not isinstance(mongo_config, MongoConfig):
             raise ValueError("config parameter must be an instance of MongoConfig class")
 
-        mongo_object = MongoSDK(mongo_config)
+        with self.mongo_worker(), self.generator_pool_scope():
+            mongo_object = self.get_mongo_sdk(mongo_config)
 
-        if initial_doc_count:
-            initial_doc_count = int(initial_doc_count)
-            current_docs = int(mongo_object.get_current_doc_count(collection_name))
-            while current_docs < initial_doc_count:
-                batch_size = self.calculate_optimal_batch_size(initial_doc_count, current_docs, 10000)
-                self.load_doc_to_mongo(mongo_config, collection_name, initial_doc_count - current_docs,
-                                       batch_size)
-                current_docs = mongo_object.get_current_doc_count(collection_name)
+            if initial_doc_count:
+                initial_doc_count = int(initial_doc_count)
+                current_docs = int(mongo_object.get_current_doc_count(collection_name))
+                while current_docs < initial_doc_count:
+                    batch_size = self.calculate_optimal_batch_size(initial_doc_count, current_docs, 10000)
+                    self.load_doc_to_mongo(mongo_config, collection_name, initial_doc_count - current_docs,
+                                           batch_size, num_generators, num_writers)
+                    current_docs = mongo_object.get_current_doc_count(collection_name)
 
-            while current_docs > initial_doc_count:
-                self.delete_random_doc(mongo_config, collection_name)
-                current_docs = mongo_object.get_current_doc_count(collection_name)
+                if current_docs > initial_doc_count:
+                    self.shrink_mongo_collection(mongo_object, collection_name, current_docs - initial_doc_count)
 
-    def perform_crud_on_mongo(self, mongo_config, collection_name, num_buffer=0):
+    def shrink_mongo_collection(self, mongo_obj, collection_name, num_docs):
+        """
+            Delete num_docs random documents, their _ids are sampled by one $sample aggregation and deleted with
+            delete_many in batches of MONGO_DELETE_BATCH_SIZE, instead of one delete and one count per document.
+            Sampled _ids can repeat, documents are sampled again until num_docs are deleted.
+
+            :param mongo_obj: object of class MongoSDK
+            :param collection_name: Name of the collection
+            :param num_docs: number of documents to delete
+            :return: number of documents deleted
+        """
+        reservoir = self.mongo_id_reservoirs[collection_name]
+        deleted = 0
+        while deleted < num_docs:
+            document_ids = mongo_obj.iter_random_document_ids(collection_name, num_docs - deleted)
+            sample_deleted = 0
+            while True:
+                batch = list(set(itertools.islice(document_ids, self.MONGO_DELETE_BATCH_SIZE)))
+                if not batch:
+                    break
+                sample_deleted += mongo_obj.delete_document(collection_name, {"_id": {"$in": batch}}).deleted_count
+                for document_id in batch:
+                    reservoir.remove(document_id)
+            if not sample_deleted:
+                break
+            deleted += sample_deleted
+        return deleted
+
+    def reconcile_mongo_doc_count(self, mongo_obj, collection_name, exact=False):
+        """
+            Replace the local document count of the CRUD with the count of the server.
+
+            :param mongo_obj: object of class MongoSDK
+            :param collection_name: Name of the collection
+            :param exact: count the documents with count_documents, else use estimated_document_count
+            which reads the collection metadata
+            :return: the document count
+        """
+        if exact:
+            self.mongo_doc_counts[collection_name] = mongo_obj.get_current_doc_count(collection_name)
+        else:
+            self.mongo_doc_counts[collection_name] = mongo_obj.get_estimated_doc_count(collection_name)
+        self.mongo_last_recounts[collection_name] = time.time()
+        return self.mongo_doc_counts[collection_name]
+
+    def perform_crud_on_mongo(self, mongo_config, collection_name, num_buffer=0, random_selection="reservoir",
+                              bulk_batch_size=0, flush_interval=1, recount_interval=None, exact_recount=False):
         """
             Perform CRUD operations on a MongoDB collection.
 
             Parameters:
             - mongo_config : Object of class SDKs.MongoDB.MongoConfig
             - collection_name (str): The name of the MongoDB collection to perform CRUD operations on.
+            - random_selection (str): How documents to update and delete are picked, "sample" runs a $sample
+              aggregation per operation, "reservoir" picks from _ids kept locally, for high rates.
+            - bulk_batch_size (int): If set, operations are collected and sent as unordered bulk_writes
+              of this many operations instead of one round trip per operation.
+            - flush_interval (float): Largest number of seconds operations wait for their bulk_write.
+            - recount_interval (float): Seconds between two reconciliations of the document count, which is
+              otherwise kept from the write results. Default is MONGO_RECOUNT_INTERVAL.
+            - exact_recount (bool): Reconcile with count_documents instead of estimated_document_count.
         """
         if not isinstance(mongo_config, MongoConfig):
             raise ValueError("config parameter must be an instance of MongoConfig class")
+        if random_selection not in self.MONGO_RANDOM_SELECTIONS:
+            raise ValueError(f"random_selection must be one of {self.MONGO_RANDOM_SELECTIONS}")
+        self.mongo_random_selection = random_selection
+
+        with self.mongo_worker():
+            mongo_object = self.get_mongo_sdk(mongo_config)
+            start_docs = self.reconcile_mongo_doc_count(mongo_object, collection_name, exact=True)
 
-        mongo_object = MongoSDK(mongo_config)
-        start_docs = mongo_object.get_current_doc_count(collection_name)
         if num_buffer == 0:
             max_files = float('inf')
             min_files = 0
         else:
             max_files = start_docs + num_buffer
             min_files = max(int(start_docs - num_buffer), 0)
+        recount_interval = recount_interval or self.MONGO_RECOUNT_INTERVAL
+        if bulk_batch_size:
+            self._bulk_crud_on_mongo(mongo_config, collection_name, min_files, max_files, bulk_batch_size,
+                                     flush_interval, recount_interval, exact_recount)
         while True:
-            while not self.stop_mongo_loader:
-                current_docs = mongo_object.get_current_doc_count(collection_name)
-                operation = random.choice(["update", "insert", "delete"])
-                if operation == "update":
-                    self.perform_random_update(mongo_config, collection_name)
-                elif operation == "insert" and current_docs < max_files:
-                    mongo_object.insert_single_document(collection_name, self.generate_docs())
-                elif operation == "delete" and current_docs > min_files:
-                    self.delete_random_doc(mongo_config, collection_name)
+            with self.mongo_worker():
+                while not self.stop_mongo_loader:
+                    try:
+                        # the client is released when the loader is stopped, get it again on every operation
+                        mongo_object = self.get_mongo_sdk(mongo_config)
+                        if time.time() - self.mongo_last_recounts[collection_name] >= recount_interval:
+                            self.reconcile_mongo_doc_count(mongo_object, collection_name, exact_recount)
+                        operation = random.choice(["update", "insert", "delete"])
+                        if operation == "update":
+                            self.perform_random_update(mongo_config, collection_name)
+                        elif operation == "insert" and self.mongo_doc_counts[collection_name] < max_files:
+                            result = mongo_object.insert_single_document(collection_name, self.generate_docs())
+                            self.mongo_id_reservoirs[collection_name].add(result.inserted_id)
+                            self.mongo_doc_counts[collection_name] += 1
+                        elif operation == "delete" and self.mongo_doc_counts[collection_name] > min_files:
+                            deleted = self.delete_random_doc(mongo_config, collection_name)
+                            self.mongo_doc_counts[collection_name] -= deleted
+                    except Exception as e:
+                        logging.info(f"Error : {str(e)}")
+            time.sleep(1)
+
+    def _bulk_crud_on_mongo(self, mongo_config, collection_name, min_files, max_files, batch_size, flush_interval,
+                            recount_interval, exact_recount):
+        """
+            Runs the CRUD operations as unordered bulk_writes of batch_size operations, sent once the batch is
+            full or flush_interval seconds after the previous one. The inserts and deletes of the batch are
+            counted in the local document count, so num_buffer bounds are kept.
+        """
+        self.mongo_crud_stats = collections.Counter()
+        last_stats_time = time.time()
+        documents = []
+        while True:
+            with self.mongo_worker():
+                while not self.stop_mongo_loader:
+                    try:
+                        mongo_object = self.get_mongo_sdk(mongo_config)
+                        if time.time() - self.mongo_last_recounts[collection_name] >= recount_interval:
+                            self.reconcile_mongo_doc_count(mongo_object, collection_name, exact_recount)
+                        current_docs = self.mongo_doc_counts[collection_name]
+                        operations = []
+                        inserted_ids = {}
+                        # _id of every DeleteOne of the batch to the index of the operation
+                        deleted_ids = {}
+                        batch_start = time.time()
+                        while len(operations) < batch_size and time.time() - batch_start < flush_interval \
+                                and not self.stop_mongo_loader:
+                            if not documents:
+                                documents = self.generate_doc_batch(batch_size)
+                            operation = random.choice(["update", "insert", "delete"])
+                            if operation == "update":
+                                random_id = self.random_mongo_id(mongo_object, collection_name)
+                                if random_id is not None:
+                                    operations.append(UpdateOne({"_id": random_id}, {"$set": documents.pop()}))
+                            elif operation == "insert" and current_docs < max_files:
+                                document = documents.pop()
+                                document["_id"] = ObjectId()
+                                inserted_ids[len(operations)] = document["_id"]
+                                operations.append(InsertOne(document))
+                                current_docs += 1
+                            elif operation == "delete" and current_docs > min_files:
+                                random_id = self.random_mongo_id(mongo_object, collection_name, remove=True)
+                                # $sample can pick a document the batch already deletes
+                                if random_id is not None and random_id not in deleted_ids:
+                                    deleted_ids[random_id] = len(operations)
+                                    operations.append(DeleteOne({"_id": random_id}))
+                                    current_docs -= 1
+                        if not operations:
+                            continue
+                        reservoir = self.mongo_id_reservoirs[collection_name]
+                        try:
+                            result = mongo_object.bulk_write(collection_name, operations)
+                        except Exception:
+                            # the documents may still exist, keep them available to updates and deletes
+                            for deleted_id in deleted_ids:
+                                reservoir.add(deleted_id)
+                            raise
+                        self.mongo_doc_counts[collection_name] += result["inserted"] - result["deleted"]
+                        failed = set(result["failed"])
+                        for index, inserted_id in inserted_ids.items():
+                            if index not in failed:
+                                reservoir.add(inserted_id)
+                        for deleted_id, index in deleted_ids.items():
+                            if index in failed:
+                                reservoir.add(deleted_id)
+                        self.mongo_crud_stats.update(inserted=result["inserted"], updated=result["modified"],
+                                                     deleted=result["deleted"], failed=len(result["failed"]),
+                                                     batches=1)
+                        if time.time() - last_stats_time >= self.CRUD_STATS_INTERVAL:
+                            logging.info(f"Bulk CRUD on mongo collection {collection_name}: "
+                                         f"{dict(self.mongo_crud_stats)}")
+                            last_stats_time = time.time()
+                    except Exception as e:
+                        logging.info(f"Error : {str(e)}")
+            time.sleep(1)
 
     def rebalance_mongo_docs(self, mongo_config, collection_name, num_docs):
-        mongo_object = MongoSDK(mongo_config)
-        current_docs = mongo_object.get_current_doc_count(collection_name)
-        while current_docs < num_docs:
-            batch_size = self.calculate_optimal_batch_size(num_docs, current_docs, 10000)
-            self.load_doc_to_mongo(mongo_config, collection_name, num_docs - current_docs, batch_size)
-            current_docs = mongo_object.get_current_doc_count(collection_name)
-        while current_docs > num_docs:
-            self.delete_random_doc(mongo_object, collection_name)
+        with self.mongo_worker(), self.generator_pool_scope():
+            mongo_object = self.get_mongo_sdk(mongo_config)
             current_docs = mongo_object.get_current_doc_count(collection_name)
+            while current_docs < num_docs:
+                batch_size = self.calculate_optimal_batch_size(num_docs, current_docs, 10000)
+                self.load_doc_to_mongo(mongo_config, collection_name, num_docs - current_docs, batch_size)
+                current_docs = mongo_object.get_current_doc_count(collection_name)
+            if current_docs > num_docs:
+                self.shrink_mongo_collection(mongo_object, collection_name, current_docs - num_docs)
 
     # -- S3 --
     def generate_random_folder_path(self, num_folders, depth_lvl):
@@ -583,33 +1438,23 @@ class DocLoader:
 
     # -- MYSQL --
     def load_data_to_mysql(self, mysql_obj, table_name, table_columns, doc_count, record_values=None):
-        for _ in range(doc_count):
-            if not record_values:
-                doc = self.generate_docs()
-                record_values = [
-                    doc["address"],
-                    doc["avg_ratings"],
-                    doc["city"],
-                    doc["country"],
-                    doc["email"],
-                    doc["free_breakfast"],
-                    doc["free_parking"],
-                    doc["name"],
-                    doc["phone"],
-                    doc["price"],
-                    json.dumps(doc["public_likes"]),
-                    json.dumps(doc["reviews"]),
-                    doc["type"],
-                    doc["url"],
-                ]
-            table_columns_without_id = [col.split()[0] for col in table_columns.split(", ") if
-                                        "AUTO_INCREMENT" not in col]
-            mysql_obj.insert_record_using_columns(table_name, table_columns_without_id, record_values)
+        table_columns_without_id = [col.split()[0] for col in table_columns.split(", ") if
+                                    "AUTO_INCREMENT" not in col]
+        if record_values:
+            for _ in range(doc_count):
+                mysql_obj.insert_record_using_columns(table_name, table_columns_without_id, record_values)
+            return
+        for documents in self.iter_doc_batches(doc_count, self.STREAM_BATCH_SIZE,
+                                               output_format="mysql" if self.pre_serialize else None):
+            for doc in documents:
+                record_values = doc if self.pre_serialize else wire_format.to_mysql_row(doc)
+                mysql_obj.insert_record_using_columns(table_name, table_columns_without_id, record_values)
 
     def setup_inital_load_on_mysql(self, mysql_obj, table_name, table_columns, initial_doc_count):
         current_doc_count = mysql_obj.get_total_records_count(table_name)
         if current_doc_count < initial_doc_count:
-            self.load_data_to_mysql(mysql_obj, table_name, table_columns, int(initial_doc_count-current_doc_count))
+            with self.generator_pool_scope():
+                self.load_data_to_mysql(mysql_obj, table_name, table_columns, int(initial_doc_count-current_doc_count))
         else:
             for _ in range(initial_doc_count - current_doc_count):
                 record_id = mysql_obj.get_random_record_id(table_name)
@@ -628,6 +1473,9 @@ class DocLoader:
         else:
             max_files = start_docs + num_buffer
             min_files = max(int(start_docs - num_buffer), 0)
+        # rows are built by wire_format.to_mysql_row, in the order of the columns of the table
+        table_columns_without_id = [col.split()[0] for col in table_columns.split(", ") if
+                                    "AUTO_INCREMENT" not in col]
 
         while True:
             while not self.stop_mysql_loader:
@@ -637,24 +1485,7 @@ class DocLoader:
                 if operation == "create" and max_files > current_records_count:
                     doc = self.generate_docs()
 
-                    table_columns_without_id = [col.split()[0] for col in table_columns.split(", ") if
-                                                "AUTO_INCREMENT" not in col]
-                    record_values = [
-                        doc["address"],
-                        doc["avg_ratings"],
-                        doc["city"],
-                        doc["country"],
-                        doc["email"],
-                        doc["free_breakfast"],
-                        doc["free_parking"],
-                        doc["name"],
-                        doc["phone"],
-                        doc["price"],
-                        json.dumps(doc["public_likes"]),
-                        json.dumps(doc["reviews"]),
-                        doc["type"],
-                        doc["url"],
-                    ]
+                    record_values = wire_format.to_mysql_row(doc)
                     mysql_obj.insert_record_using_columns(table_name, table_columns_without_id, record_values)
 
                 elif operation == "update":
@@ -662,25 +1493,7 @@ class DocLoader:
                     if record_id is not None:
                         doc = self.generate_docs()
 
-                        public_likes_json = json.dumps(doc["public_likes"])
-                        reviews_json = json.dumps(doc["reviews"])
-
-                        update_values = {
-                            "address": doc["address"],
-                            "avg_rating": doc["avg_ratings"],
-                            "city": doc["city"],
-                            "country": doc["country"],
-                            "email": doc["email"],
-                            "free_breakfast": doc["free_breakfast"],
-                            "free_parking": doc["free_parking"],
-                            "name": doc["name"],
-                            "phone": doc["phone"],
-                            "price": doc["price"],
-                            "public_likes": public_likes_json,
-                            "reviews": reviews_json,
-                            "type": doc["type"],
-                            "url": doc["url"],
-                        }
+                        update_values = dict(zip(table_columns_without_id, wire_format.to_mysql_row(doc)))
                         update_query = f"UPDATE {table_name} SET " + ", ".join(
                             [f"{column} = %s" for column in update_values.keys()]) + f" WHERE id = {record_id}"
 
@@ -722,28 +1535,7 @@ class DocLoader:
                 except Exception as e:
                     print(f"Error during delete operation: {e}")
 
-        while current_records_count < doc_count:
-            doc = self.generate_docs()
-
-            table_columns_without_id = [col.split()[0] for col in table_columns.split(", ") if
-                                        "AUTO_INCREMENT" not in col]
-
-            if not record_values:
-                record_values = [
-                    doc["address"],
-                    doc["avg_ratings"],
-                    doc["city"],
-                    doc["country"],
-                    doc["email"],
-                    doc["free_breakfast"],
-                    doc["free_parking"],
-                    doc["name"],
-                    doc["phone"],
-                    doc["price"],
-                    json.dumps(doc["public_likes"]),
-                    json.dumps(doc["reviews"]),
-                    doc["type"],
-                    doc["url"],
-                ]
-            mysql_obj.insert_record_using_columns(table_name, table_columns_without_id, record_values)
-            current_records_count += 1
+        if current_records_count < doc_count:
+            with self.generator_pool_scope():
+                self.load_data_to_mysql(mysql_obj, table_name, table_columns, doc_count - current_records_count,
+                                        record_values)
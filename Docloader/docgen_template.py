@@ -1,39 +1,123 @@
 """
 Document template for the docloader
 """
+import datetime
+import hashlib
 import json
 import random
-import string
+
+from Docloader.size_distribution import PADDING_BUFFER_SIZE, pooled_padding
+
+# Cost in bytes of the ", " json.dumps places between two items of a list
+LIST_SEPARATOR_SIZE = len(", ")
+
+# Review dates of seeded documents are generated between these dates instead of relative to "now",
+# so a seeded document does not change with the time it is generated at
+SEEDED_REVIEW_START_DATE = datetime.datetime(2014, 1, 1)
+SEEDED_REVIEW_END_DATE = datetime.datetime(2024, 1, 1)
+
+
+def document_seed(seed, key, version=0):
+    """
+    Seed for the document with the given key at the given mutation version.
+    Derived with sha256 so it is the same in every process, unlike hash().
+    :param seed: seed of the loader
+    :param key: key of the document
+    :param version: mutation version of the document
+    :return: 64 bit integer seed
+    """
+    digest = hashlib.sha256(f"{seed}:{key}:{version}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def encoded_size(obj):
+    """
+    Size in bytes of the UTF-8 encoded JSON representation of an object
+    :param obj: object to measure, nested template objects are serialized through their to_dict
+    :return: size in bytes
+    """
+    return len(json.dumps(obj, default=lambda x: x.to_dict(), ensure_ascii=False).encode("utf-8"))
+
+
+class DocumentSizeTracker:
+    """
+    Keeps a running count of the encoded size of a document while items are appended
+    to one of its lists, so the document is never re-serialized to know its size.
+    params:
+    -base_size: encoded size of the document with the list still empty
+    """
+
+    def __init__(self, base_size):
+        self.size = base_size
+        self.num_items = 0
+
+    def fits(self, item_size, document_size):
+        """
+        Check whether an item of the given size can still be appended
+        :param item_size: encoded size of the item
+        :param document_size: target size of the document in bytes
+        :return: True if the item fits
+        """
+        return self.size + item_size <= document_size
+
+    def add(self, item_size):
+        """
+        Account for an item appended to the list
+        :param item_size: encoded size of the item
+        """
+        if self.num_items:
+            self.size += LIST_SEPARATOR_SIZE
+        self.size += item_size
+        self.num_items += 1
 
 
 class Rating:
     """
     Stores rating for class Review
     """
+    __slots__ = ("value", "cleanliness", "overall")
 
     def __init__(self):
         self.value = None
         self.cleanliness = None
         self.overall = None
 
+    def to_dict(self):
+        """
+        :return: the rating as a plain dictionary
+        """
+        return {"value": self.value, "cleanliness": self.cleanliness, "overall": self.overall}
+
 
 class Review:
     """
     Stores review for class Hotel
     params:
     -faker_instance
+    -end_date: latest date of the review. Default is "now"
+    -start_date: earliest date of the review. Default is "-10y"
     """
+    __slots__ = ("date", "author", "rating")
 
-    def __init__(self, faker_instance):
-        self.date = faker_instance.date_time_between(start_date="-10y", end_date="now").isoformat()
+    def __init__(self, faker_instance, end_date="now", start_date="-10y"):
+        self.date = faker_instance.date_time_between(start_date=start_date, end_date=end_date).isoformat()
         self.author = faker_instance.name()
         self.rating = Rating()
 
+    def to_dict(self):
+        """
+        :return: the review as a plain dictionary
+        """
+        return {"date": self.date, "author": self.author, "rating": self.rating.to_dict()}
+
 
 class Hotel:
     """
     Stores Hotel information to generate document for the doc_loader
     """
+    __slots__ = ("document_size", "country", "address", "free_parking", "city", "type", "url", "reviews",
+                 "phone", "price", "avg_ratings", "free_breakfast", "name", "public_likes", "email", "mutated",
+                 "padding", "key")
 
     def __init__(self, faker_instance):
         self.document_size = None
@@ -57,13 +141,41 @@ class Hotel:
         self.padding = ""
         self.key = None
 
-    def generate_review(self, faker_instance):
+    def to_dict(self):
+        """
+        Converts the hotel to the document sent to the sources, without going through json
+        :return: the hotel as a plain dictionary
+        """
+        return {
+            "document_size": self.document_size,
+            "country": self.country,
+            "address": self.address,
+            "free_parking": self.free_parking,
+            "city": self.city,
+            "type": self.type,
+            "url": self.url,
+            "reviews": [review.to_dict() for review in self.reviews],
+            "phone": self.phone,
+            "price": self.price,
+            "avg_ratings": self.avg_ratings,
+            "free_breakfast": self.free_breakfast,
+            "name": self.name,
+            "public_likes": list(self.public_likes),
+            "email": self.email,
+            "mutated": self.mutated,
+            "padding": self.padding,
+            "key": self.key
+        }
+
+    def generate_review(self, faker_instance, end_date="now", start_date="-10y"):
         """
         Generated random Review for a hotel
         :param faker_instance:
+        :param end_date: latest date of the review
+        :param start_date: earliest date of the review
         :return: object of class Review
         """
-        review = Review(faker_instance)
+        review = Review(faker_instance, end_date, start_date)
         review.rating.value = faker_instance.random_int(min=0, max=10)
         review.rating.cleanliness = faker_instance.random_int(min=0, max=10)
         review.rating.overall = faker_instance.random_int(min=1, max=10)
@@ -77,26 +189,31 @@ class Hotel:
         num_likes = faker_instance.random_int(min=0, max=10)
         self.public_likes = [faker_instance.name() for _ in range(num_likes)]
 
-    def generate_document(self, faker_instance, document_size, key=None):
+    def generate_document(self, faker_instance, document_size, key=None, random_instance=random,
+                          review_end_date="now", review_start_date="-10y"):
         """
         Generates document os a given size in bytes.
         :param key: in-case of custom key requirement
         :param faker_instance:
         :param document_size:
+        :param random_instance: source of randomness for the padding, pass a seeded random.Random
+        for reproducible documents
+        :param review_end_date: latest date of the reviews
+        :param review_start_date: earliest date of the reviews, pass an absolute date with review_end_date
+        for reproducible documents
         """
         self.reviews = []
         self.key = key
         self.document_size = document_size
         self.generate_public_likes(faker_instance)
+        tracker = DocumentSizeTracker(encoded_size(self.to_dict()))
         while True:
-            new_review = self.generate_review(faker_instance)
-            document = json.dumps(self.__dict__, default=lambda x: x.__dict__,
-                                  ensure_ascii=False)
-            new_review_doc = json.dumps(new_review.__dict__, default=lambda x: x.__dict__,
-                                        ensure_ascii=False)
-            if len(document.encode("utf-8")) + len(new_review_doc.encode("utf-8")) <= document_size:
+            new_review = self.generate_review(faker_instance, review_end_date, review_start_date)
+            review_size = encoded_size(new_review.to_dict())
+            if tracker.fits(review_size, document_size):
                 self.reviews.append(new_review)
+                tracker.add(review_size)
             else:
-                required_length = document_size - len(document.encode("utf-8"))
-                self.padding = ''.join(random.choices(string.ascii_letters, k=required_length))
+                required_length = document_size - tracker.size
+                self.padding = pooled_padding(required_length, random_instance.randrange(PADDING_BUFFER_SIZE))
                 break
@@ -0,0 +1,210 @@
+"""
+Vectorized document generator for the docloader.
+Vocabularies for the Hotel fields are built with Faker once per process, documents are
+then assembled by sampling whole batches of vocabulary indexes with NumPy.
+"""
+import threading
+
+import faker
+import numpy as np
+
+from Docloader.docgen_template import DocumentSizeTracker, SEEDED_REVIEW_END_DATE, SEEDED_REVIEW_START_DATE, \
+    document_seed, encoded_size
+from Docloader.size_distribution import PADDING_BUFFER_SIZE, pooled_padding
+
+PRICES = (1000.0, 2000.0, 3000.0, 4000.0, 5000.0, 6000.0,
+          7000.0, 8000.0, 9000.0, 10000.0)
+
+# Encoded size of a review with empty strings and single digit ratings, minus the
+# quotes of the two strings and the three digits which are accounted separately.
+REVIEW_OVERHEAD = encoded_size({"date": "", "author": "",
+                                "rating": {"value": 0, "cleanliness": 0, "overall": 0}}) - 4 - 3
+
+
+class Vocabulary:
+    """
+    Pre-computed values for every Faker generated field of the Hotel document.
+    Building it is expensive, use Vocabulary.get() to share one instance per process.
+    :params:
+    -vocabulary_size: number of values generated for each field. Default is 5000
+    -seed: seeds Faker so every process builds the same vocabulary. Default is None
+    """
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, vocabulary_size=5000, seed=None):
+        faker_instance = faker.Faker()
+        review_start_date, review_end_date = "-10y", "now"
+        if seed is not None:
+            faker_instance.seed_instance(seed)
+            review_start_date, review_end_date = SEEDED_REVIEW_START_DATE, SEEDED_REVIEW_END_DATE
+        self.names = self._build(lambda: faker_instance.name(), vocabulary_size)
+        self.countries = self._build(lambda: faker_instance.country(), vocabulary_size)
+        self.addresses = self._build(lambda: faker_instance.address(), vocabulary_size)
+        self.cities = self._build(lambda: faker_instance.city(), vocabulary_size)
+        self.urls = self._build(lambda: faker_instance.url(), vocabulary_size)
+        self.phones = self._build(lambda: faker_instance.phone_number(), vocabulary_size)
+        self.emails = self._build(lambda: faker_instance.email(), vocabulary_size)
+        self.dates = self._build(
+            lambda: faker_instance.date_time_between(start_date=review_start_date, end_date=review_end_date).isoformat(),
+            vocabulary_size)
+        self.words = self._build(lambda: faker_instance.word(), vocabulary_size)
+        # encoded sizes are only needed for the fields that make up a review
+        self.name_sizes = self._encoded_sizes(self.names)
+        self.date_sizes = self._encoded_sizes(self.dates)
+
+    @staticmethod
+    def _build(generator, vocabulary_size):
+        return np.array([generator() for _ in range(vocabulary_size)], dtype=object)
+
+    @staticmethod
+    def _encoded_sizes(values):
+        return np.array([encoded_size(value) for value in values], dtype=np.int64)
+
+    @classmethod
+    def get(cls, vocabulary_size=5000, seed=None):
+        """
+        Return the process wide vocabulary of the given size and seed, building it on first use
+        :param vocabulary_size: number of values generated for each field
+        :param seed: seed of the vocabulary
+        :return: object of class Vocabulary
+        """
+        with cls._lock:
+            if (vocabulary_size, seed) not in cls._instances:
+                cls._instances[(vocabulary_size, seed)] = Vocabulary(vocabulary_size, seed)
+            return cls._instances[(vocabulary_size, seed)]
+
+
+class VocabularyDocGenerator:
+    """
+    Generates Hotel documents in batches by sampling a shared Vocabulary.
+    Documents have the same schema and size as the ones built from docgen_template.Hotel.
+    :params:
+    -vocabulary_size: Default is 5000
+    -review_chunk_size: number of candidate reviews sampled at once. Default is 1024
+    -seed: if set, documents can be generated with generate_seeded_batch as a pure function
+    of (seed, key, version). Default is None
+    """
+
+    def __init__(self, vocabulary_size=5000, review_chunk_size=1024, seed=None):
+        self.vocabulary = Vocabulary.get(vocabulary_size, seed)
+        self.review_chunk_size = review_chunk_size
+        self.seed = seed
+        self.rng = np.random.default_rng()
+        self.lock = threading.Lock()
+        # candidate reviews left over are kept for the next batch
+        self.reviews = []
+
+    @staticmethod
+    def _sample(rng, values, count):
+        return values[rng.integers(0, len(values), count)].tolist()
+
+    def _review_chunk(self, rng, count):
+        """
+        Sample a chunk of candidate reviews along with their encoded sizes
+        :return: list of (review, size) tuples
+        """
+        vocabulary = self.vocabulary
+        author_idx = rng.integers(0, len(vocabulary.names), count)
+        date_idx = rng.integers(0, len(vocabulary.dates), count)
+        ratings = rng.integers(0, 11, (3, count))
+        ratings[2] = rng.integers(1, 11, count)
+        sizes = (REVIEW_OVERHEAD + vocabulary.name_sizes[author_idx] + vocabulary.date_sizes[date_idx]
+                 + (ratings >= 10).sum(axis=0) + 3)
+        reviews = []
+        for date, author, value, cleanliness, overall, size in zip(
+                vocabulary.dates[date_idx].tolist(), vocabulary.names[author_idx].tolist(),
+                ratings[0].tolist(), ratings[1].tolist(), ratings[2].tolist(), sizes.tolist()):
+            reviews.append(({"date": date, "author": author,
+                             "rating": {"value": value, "cleanliness": cleanliness, "overall": overall}}, size))
+        return reviews
+
+    def generate_batch(self, batch_size, document_size, keys=None):
+        """
+        Generate a batch of documents
+        :param batch_size: number of documents to generate
+        :param document_size: size of each document in bytes, or a list with the size of every document
+        :param keys: optional list of keys, one for each document
+        :return: list of dictionaries
+        """
+        with self.lock:
+            return self._generate_batch(self.rng, self.reviews, self.review_chunk_size,
+                                        batch_size, document_size, keys)
+
+    def generate_seeded_batch(self, document_size, keys, version=0):
+        """
+        Generate the documents with the given keys at the given mutation version.
+        Every document gets its own random generator seeded from (seed, key, version),
+        so it does not depend on the batch it is generated in.
+        :param document_size: size of each document in bytes, or a list with the size of every document
+        :param keys: list of keys, one for each document
+        :param version: mutation version of the documents
+        :return: list of dictionaries
+        """
+        if self.seed is None:
+            raise ValueError("generator has to be created with a seed to generate seeded documents")
+        document_sizes = document_size if isinstance(document_size, list) else [document_size] * len(keys)
+        documents = []
+        for key, size in zip(keys, document_sizes):
+            rng = np.random.default_rng(document_seed(self.seed, key, version))
+            # roughly the number of reviews a document needs, more are sampled if it runs out
+            review_chunk_size = size // 64 + 2
+            documents.extend(self._generate_batch(rng, [], review_chunk_size, 1, size, [key], version))
+        return documents
+
+    def _generate_batch(self, rng, reviews, review_chunk_size, batch_size, document_size, keys, version=0):
+        vocabulary = self.vocabulary
+        document_sizes = document_size if isinstance(document_size, list) else [document_size] * batch_size
+        countries = self._sample(rng, vocabulary.countries, batch_size)
+        addresses = self._sample(rng, vocabulary.addresses, batch_size)
+        cities = self._sample(rng, vocabulary.cities, batch_size)
+        urls = self._sample(rng, vocabulary.urls, batch_size)
+        phones = self._sample(rng, vocabulary.phones, batch_size)
+        names = self._sample(rng, vocabulary.names, batch_size)
+        emails = self._sample(rng, vocabulary.emails, batch_size)
+        free_parking = rng.integers(0, 2, batch_size).tolist()
+        free_breakfast = rng.integers(0, 2, batch_size).tolist()
+        prices = np.array(PRICES)[rng.integers(0, len(PRICES), batch_size)].tolist()
+        avg_ratings = (rng.integers(1, 100, batch_size) / 10).tolist()
+
+        num_likes = rng.integers(0, 11, batch_size)
+        likes = self._sample(rng, vocabulary.names, int(num_likes.sum()))
+        like_offsets = np.concatenate(([0], np.cumsum(num_likes))).tolist()
+
+        documents = []
+        padding_offsets = rng.integers(0, PADDING_BUFFER_SIZE, batch_size).tolist()
+        for i in range(batch_size):
+            document_size = document_sizes[i]
+            document = {
+                "document_size": document_size,
+                "country": countries[i],
+                "address": addresses[i],
+                "free_parking": free_parking[i],
+                "city": cities[i],
+                "type": "Hotel",
+                "url": urls[i],
+                "reviews": [],
+                "phone": phones[i],
+                "price": prices[i],
+                "avg_ratings": avg_ratings[i],
+                "free_breakfast": free_breakfast[i],
+                "name": names[i],
+                "public_likes": likes[like_offsets[i]:like_offsets[i + 1]],
+                "email": emails[i],
+                "mutated": float(version),
+                "padding": "",
+                "key": keys[i] if keys else None
+            }
+            tracker = DocumentSizeTracker(encoded_size(document))
+            while True:
+                if not reviews:
+                    reviews.extend(self._review_chunk(rng, review_chunk_size))
+                review, review_size = reviews.pop()
+                if tracker.fits(review_size, document_size):
+                    document["reviews"].append(review)
+                    tracker.add(review_size)
+                else:
+                    document["padding"] = pooled_padding(document_size - tracker.size, padding_offsets[i])
+                    break
+            documents.append(document)
+        return documents
@@ -0,0 +1,165 @@
+"""
+In-memory reservoir of keys known to exist in a source, so random deletes and updates can pick a key
+locally instead of scanning the source on every operation.
+"""
+import random
+import threading
+import time
+
+
+class KeyReservoir:
+    """
+    Uniform sample of at most capacity keys, kept with reservoir sampling.
+    Keys are added as documents are inserted and the reservoir is refilled from a scan of the
+    source when it runs empty or gets older than refresh_interval. Only one scan runs at a time,
+    keys added and removed while it runs are applied to the new sample.
+    :params:
+    -capacity: largest number of keys kept. Default is 100000
+    -refresh_interval: seconds after which needs_refresh is true again. Default is 600
+    -empty_refresh_interval: seconds before the source is scanned again after a scan found no keys,
+    doubled after every such scan up to refresh_interval. Default is 5
+    """
+
+    def __init__(self, capacity=100000, refresh_interval=600, empty_refresh_interval=5):
+        self.capacity = capacity
+        self.refresh_interval = refresh_interval
+        self.empty_refresh_interval = empty_refresh_interval
+        # consecutive refreshes which found no keys, the source is empty
+        self.empty_refreshes = 0
+        self.keys = []
+        # position of every key in self.keys, so a key is removed in constant time
+        self.positions = {}
+        # keys offered since the last refresh, for the reservoir sampling
+        self.seen = 0
+        self.last_refresh = None
+        # adds and removes made while a refresh scans the source, None when no refresh runs
+        self.changes = None
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key):
+        """
+        Offer a key, it is kept if the reservoir is not full, else it replaces a random key
+        with probability capacity / keys offered
+        """
+        with self.lock:
+            self._add(key)
+
+    def _add(self, key):
+        if self.changes is not None:
+            self.changes.append((True, key))
+        if key in self.positions:
+            return
+        self.seen += 1
+        if len(self.keys) < self.capacity:
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+            return
+        position = random.randrange(self.seen)
+        if position < self.capacity:
+            del self.positions[self.keys[position]]
+            self.keys[position] = key
+            self.positions[key] = position
+
+    def remove(self, key):
+        """
+        Remove a key, eg: once the document is deleted
+        """
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        if self.changes is not None:
+            self.changes.append((False, key))
+        position = self.positions.pop(key, None)
+        if position is None:
+            return
+        last_key = self.keys.pop()
+        if position < len(self.keys):
+            self.keys[position] = last_key
+            self.positions[last_key] = position
+
+    def pick(self):
+        """
+        :return: a random key, None if the reservoir is empty
+        """
+        with self.lock:
+            return random.choice(self.keys) if self.keys else None
+
+    def sample(self, count):
+        """
+        :return: list of up to count distinct random keys
+        """
+        with self.lock:
+            return random.sample(self.keys, min(count, len(self.keys)))
+
+    def pop(self):
+        """
+        Remove and return a random key, None if the reservoir is empty
+        """
+        with self.lock:
+            if not self.keys:
+                return None
+            key = random.choice(self.keys)
+            self._remove(key)
+            return key
+
+    def needs_refresh(self):
+        """
+        :return: True if the reservoir is empty or was last refreshed more than refresh_interval ago.
+        Once a refresh found the source empty it is only true again after a backoff, so an empty
+        source is not scanned on every call
+        """
+        if self.last_refresh is None:
+            return True
+        elapsed = time.time() - self.last_refresh
+        if self.keys or not self.empty_refreshes:
+            return not self.keys or elapsed > self.refresh_interval
+        return elapsed > min(self.refresh_interval, self.empty_refresh_interval * 2 ** (self.empty_refreshes - 1))
+
+    def refresh_if_needed(self, scan):
+        """
+        Refresh the reservoir if needs_refresh. A single caller runs the scan, the others keep using
+        the current sample, or wait for the scan if the reservoir is empty.
+        :param scan: function returning an iterable of every key of the source
+        """
+        if not self.needs_refresh():
+            return
+        if not self.refresh_lock.acquire(blocking=not self.keys):
+            return
+        try:
+            # another caller may have refreshed while this one waited
+            if self.needs_refresh():
+                self.refresh(scan())
+        finally:
+            self.refresh_lock.release()
+
+    def refresh(self, keys):
+        """
+        Replace the reservoir with a sample of the keys read from the source, keys added and removed
+        while the keys are read are applied to the new sample
+        :param keys: iterable of every key of the source, the reservoir stays usable while it is consumed
+        """
+        with self.lock:
+            self.changes = []
+        sample = KeyReservoir(self.capacity, self.refresh_interval, self.empty_refresh_interval)
+        try:
+            for key in keys:
+                sample._add(key)
+        except Exception:
+            with self.lock:
+                self.changes = None
+            raise
+        with self.lock:
+            for added, key in self.changes:
+                if added:
+                    sample._add(key)
+                else:
+                    sample._remove(key)
+            self.changes = None
+            self.keys, self.positions, self.seen = sample.keys, sample.positions, sample.seen
+            self.empty_refreshes = 0 if self.keys else self.empty_refreshes + 1
+            self.last_refresh = time.time()
@@ -0,0 +1,44 @@
+"""
+Latency tracking for the docloader workloads
+"""
+import collections
+import threading
+
+
+class LatencyRecorder:
+    """
+    Latencies of the most recent calls of a workload, summarised as percentiles.
+    :params:
+    -window: number of recent calls the percentiles are computed on. Default is 10000
+    """
+
+    def __init__(self, window=10000):
+        self.latencies = collections.deque(maxlen=window)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        """
+        Record the latency of a call
+        :param seconds: duration of the call, eg: from time.perf_counter()
+        """
+        with self.lock:
+            self.latencies.append(seconds)
+            self.calls += 1
+
+    def summary(self):
+        """
+        :return: dictionary with the number of calls and the p50, p95, p99 and max latency of the
+        recent calls in milliseconds
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+            calls = self.calls
+        if not latencies:
+            return {"calls": calls}
+
+        def percentile(fraction):
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 3)
+
+        return {"calls": calls, "p50_ms": percentile(0.5), "p95_ms": percentile(0.95),
+                "p99_ms": percentile(0.99), "max_ms": round(latencies[-1] * 1000, 3)}
@@ -0,0 +1,47 @@
+"""
+Rate limiting for the docloader workloads
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket shared by the worker threads of a workload, every operation takes a token.
+    Tokens are added at rate per second, up to burst tokens are kept when the workers fall behind.
+    :params:
+    -rate: target operations per second, None or 0 for no limit
+    -burst: largest number of tokens kept. Default is one second worth of tokens
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self.lock = threading.Lock()
+        self.tokens = 0.0
+        self.last_refill = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        """
+        Change the target rate, eg: while a workload is running
+        """
+        with self.lock:
+            self.rate = rate
+            self.burst = burst or max(1.0, rate or 0.0)
+            self.tokens = min(self.tokens, self.burst)
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens, blocking until they are available
+        """
+        while True:
+            with self.lock:
+                if not self.rate:
+                    return
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate
+            time.sleep(wait_time)
@@ -0,0 +1,148 @@
+"""
+Document size distributions and padding for the docloader.
+Padding is sliced out of one buffer of random letters generated once per process, instead of
+sampling every character of every document.
+"""
+import math
+import random
+import string
+import threading
+
+PADDING_BUFFER_SIZE = 4 * 1024 * 1024
+# maps the byte values below _LETTER_BYTES_LIMIT to an ascii letter, 4 values per letter so every letter is
+# equally likely. Larger values are dropped instead of biasing the first letters
+_LETTER_BYTES_LIMIT = 256 - 256 % len(string.ascii_letters)
+_LETTER_TABLE = bytes(ord(string.ascii_letters[i % len(string.ascii_letters)]) for i in range(256))
+_DROPPED_BYTES = bytes(range(_LETTER_BYTES_LIMIT, 256))
+
+_padding_buffer = None
+_padding_lock = threading.Lock()
+
+
+def padding_buffer():
+    """
+    Return the process wide padding buffer, generating it on first use.
+    It is generated from a fixed seed, so seeded documents get the same padding in every process.
+    """
+    global _padding_buffer
+    with _padding_lock:
+        if _padding_buffer is None:
+            rng = random.Random(0)
+            letters = bytearray()
+            while len(letters) < PADDING_BUFFER_SIZE:
+                letters += rng.randbytes(PADDING_BUFFER_SIZE).translate(_LETTER_TABLE, _DROPPED_BYTES)
+            _padding_buffer = letters[:PADDING_BUFFER_SIZE].decode("ascii")
+        return _padding_buffer
+
+
+def pooled_padding(length, offset):
+    """
+    Padding of the given length sliced from the padding buffer
+    :param length: length of the padding
+    :param offset: position in the buffer to start from, any integer
+    :return: string of ascii letters
+    """
+    if length <= 0:
+        return ""
+    buffer = padding_buffer()
+    offset %= len(buffer)
+    if offset + length <= len(buffer):
+        return buffer[offset:offset + length]
+    return (buffer[offset:] + buffer * math.ceil(length / len(buffer)))[:length]
+
+
+class FixedSize:
+    """
+    Every document has the same size
+    :params:
+    -size: document size in bytes
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.fixed_size = size
+
+    def sample(self, random_instance=random):
+        return self.size
+
+
+class UniformSize:
+    """
+    Document sizes uniformly distributed between min_size and max_size, both included
+    """
+
+    def __init__(self, min_size, max_size):
+        if min_size > max_size:
+            raise ValueError("min must not be greater than max")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.fixed_size = None
+
+    def sample(self, random_instance=random):
+        return random_instance.randint(self.min_size, self.max_size)
+
+
+class NormalSize:
+    """
+    Normally distributed document sizes, clipped to [min_size, max_size]
+    """
+
+    def __init__(self, mean, stddev, min_size=1, max_size=None):
+        self.mean = mean
+        self.stddev = stddev
+        self.min_size = min_size
+        self.max_size = max_size
+        self.fixed_size = None
+
+    def sample(self, random_instance=random):
+        size = max(self.min_size, round(random_instance.gauss(self.mean, self.stddev)))
+        return min(size, self.max_size) if self.max_size else size
+
+
+class HistogramSize:
+    """
+    Document sizes following a histogram
+    :params:
+    -buckets: list of [min_size, max_size, weight]. A bucket is picked by weight and the size is
+    uniformly distributed within it
+    """
+
+    def __init__(self, buckets):
+        if not buckets:
+            raise ValueError("histogram needs at least one bucket")
+        self.buckets = [(int(min_size), int(max_size)) for min_size, max_size, _ in buckets]
+        self.cum_weights = []
+        total = 0
+        for _, _, weight in buckets:
+            total += weight
+            self.cum_weights.append(total)
+        self.fixed_size = None
+
+    def sample(self, random_instance=random):
+        min_size, max_size = random_instance.choices(self.buckets, cum_weights=self.cum_weights)[0]
+        return random_instance.randint(min_size, max_size)
+
+
+def create_size_distribution(spec):
+    """
+    Create a size distribution from its spec
+    :param spec: size in bytes, or one of
+        {"type": "fixed", "size": 1024}
+        {"type": "uniform", "min": 512, "max": 4096}
+        {"type": "normal", "mean": 2048, "stddev": 512, "min": 256, "max": 8192}
+        {"type": "histogram", "buckets": [[256, 1024, 70], [1024, 16384, 25], [65536, 65536, 5]]}
+    :return: object with a sample(random_instance) method returning a size in bytes
+    """
+    if isinstance(spec, int):
+        return FixedSize(spec)
+    distribution_type = spec.get("type")
+    if distribution_type == "fixed":
+        return FixedSize(spec["size"])
+    elif distribution_type == "uniform":
+        return UniformSize(spec["min"], spec["max"])
+    elif distribution_type == "normal":
+        return NormalSize(spec["mean"], spec["stddev"], spec.get("min", 1), spec.get("max"))
+    elif distribution_type == "histogram":
+        return HistogramSize(spec["buckets"])
+    raise ValueError(f"Unknown size distribution {distribution_type}, "
+                     f"expected one of fixed, uniform, normal, histogram")
@@ -0,0 +1,247 @@
+"""
+Registry of declarative document templates for the docloader.
+A template describes the fields of a document, their types and how they are generated, and can nest
+objects and arrays. It is compiled once into a generator function, so generating a document does not
+interpret the template again.
+
+Example:
+    register_template("user", {
+        "fields": {
+            "id": {"type": "uuid"},
+            "name": {"type": "name"},
+            "age": {"type": "int", "min": 18, "max": 90},
+            "address": {"type": "object", "fields": {"city": {"type": "city"}}},
+            "tags": {"type": "array", "items": {"type": "word"}, "min_items": 0, "max_items": 5}
+        }
+    })
+
+Field types:
+    name, country, address, city, url, phone, email, date, word: sampled from the shared Vocabulary
+    int: "min", "max"
+    float: "min", "max", "digits"
+    choice: "values"
+    constant: "value"
+    string: random ascii letters of "length"
+    uuid: random uuid4 string
+    key: key of the document
+    object: nested "fields"
+    array: "items" template, "min_items" and "max_items" (or "count")
+
+The "padding_field" of a template (default "padding") is filled from the padding buffer so the json
+encoded document is document_size bytes.
+"""
+import string
+import threading
+import uuid
+
+from Docloader.docgen_template import encoded_size
+from Docloader.docgen_vocabulary import Vocabulary
+from Docloader.size_distribution import PADDING_BUFFER_SIZE, pooled_padding
+
+# documents of this template are built by docgen_template.Hotel and are not in the registry
+HOTEL_TEMPLATE = "hotel"
+
+# field type -> attribute of the Vocabulary it is sampled from
+VOCABULARY_TYPES = {"name": "names", "country": "countries", "address": "addresses", "city": "cities",
+                    "url": "urls", "phone": "phones", "email": "emails", "date": "dates", "word": "words"}
+# required keys of the field types that are not sampled from the vocabulary
+FIELD_TYPES = {"int": (), "float": (), "choice": ("values",), "constant": ("value",), "string": (), "uuid": (),
+               "key": (), "object": ("fields",), "array": ("items",)}
+
+_templates = {}
+_compiled_templates = {}
+_lock = threading.Lock()
+
+
+class CompiledTemplate:
+    """
+    A template compiled to a generator function
+    :params:
+    -name: name of the template
+    -generate_fields: function (random_instance, key) -> document without padding
+    -padding_field: field filled to reach the document size
+    """
+
+    def __init__(self, name, generate_fields, padding_field):
+        self.name = name
+        self.generate_fields = generate_fields
+        self.padding_field = padding_field
+
+    def generate(self, random_instance, document_size, key=None):
+        """
+        Generate a document
+        :param random_instance: random.Random used for every value of the document
+        :param document_size: size of the json encoded document in bytes
+        :param key: key of the document
+        :return: a dictionary
+        """
+        document = self.generate_fields(random_instance, key)
+        document[self.padding_field] = ""
+        document[self.padding_field] = pooled_padding(document_size - encoded_size(document),
+                                                      random_instance.randrange(PADDING_BUFFER_SIZE))
+        return document
+
+
+def _validate_field(name, field):
+    """
+    Check the spec of a field without compiling it, so registering does not build the vocabulary
+    """
+    field_type = field.get("type")
+    if field_type not in VOCABULARY_TYPES and field_type not in FIELD_TYPES:
+        raise ValueError(f"Unknown field type {field_type} for field {name}")
+    for required in FIELD_TYPES.get(field_type, ()):
+        if required not in field:
+            raise ValueError(f"Field {name} of type {field_type} needs {required}")
+    if field_type == "object":
+        for child_name, child in field["fields"].items():
+            _validate_field(f"{name}.{child_name}", child)
+    elif field_type == "array":
+        _validate_field(f"{name}[]", field["items"])
+
+
+def _compile_field(field, vocabulary):
+    """
+    Compile the spec of a field to a function (random_instance, key) -> value
+    """
+    field_type = field["type"]
+    if field_type in VOCABULARY_TYPES:
+        values = getattr(vocabulary, VOCABULARY_TYPES[field_type]).tolist()
+        return lambda random_instance, key: random_instance.choice(values)
+    elif field_type == "int":
+        low, high = field.get("min", 0), field.get("max", 100)
+        return lambda random_instance, key: random_instance.randint(low, high)
+    elif field_type == "float":
+        low, high, digits = field.get("min", 0.0), field.get("max", 1.0), field.get("digits", 2)
+        return lambda random_instance, key: round(random_instance.uniform(low, high), digits)
+    elif field_type == "choice":
+        values = list(field["values"])
+        return lambda random_instance, key: random_instance.choice(values)
+    elif field_type == "constant":
+        value = field["value"]
+        return lambda random_instance, key: value
+    elif field_type == "string":
+        length = field.get("length", 16)
+        return lambda random_instance, key: ''.join(random_instance.choices(string.ascii_letters, k=length))
+    elif field_type == "uuid":
+        return lambda random_instance, key: str(uuid.UUID(int=random_instance.getrandbits(128), version=4))
+    elif field_type == "key":
+        return lambda random_instance, key: key
+    elif field_type == "object":
+        return _compile_object(field["fields"], vocabulary)
+    elif field_type == "array":
+        generate_item = _compile_field(field["items"], vocabulary)
+        min_items = field.get("min_items", field.get("count", 0))
+        max_items = field.get("max_items", field.get("count", 5))
+        return lambda random_instance, key: [generate_item(random_instance, key)
+                                             for _ in range(random_instance.randint(min_items, max_items))]
+    raise ValueError(f"Unknown field type {field_type}")
+
+
+def _compile_object(fields, vocabulary):
+    generators = [(name, _compile_field(field, vocabulary)) for name, field in fields.items()]
+    return lambda random_instance, key: {name: generate(random_instance, key) for name, generate in generators}
+
+
+def register_template(name, template):
+    """
+    Register a declarative template under a name. It is compiled on first use.
+    :param name: name used to select the template
+    :param template: {"fields": {...}, "padding_field": "padding"}
+    """
+    if name == HOTEL_TEMPLATE:
+        raise ValueError(f"{HOTEL_TEMPLATE} is reserved for the docgen_template.Hotel documents")
+    for field_name, field in template["fields"].items():
+        _validate_field(field_name, field)
+    with _lock:
+        _templates[name] = template
+        for compiled_key in [compiled_key for compiled_key in _compiled_templates if compiled_key[0] == name]:
+            del _compiled_templates[compiled_key]
+
+
+def get_template(name, seed=None):
+    """
+    Return the compiled template, compiling it on first use
+    :param name: name of a registered template
+    :param seed: seed of the vocabulary the template samples from
+    :return: object of class CompiledTemplate
+    """
+    with _lock:
+        if name not in _templates:
+            raise ValueError(f"Unknown template {name}, available templates are {template_names()}")
+        if (name, seed) not in _compiled_templates:
+            template = _templates[name]
+            _compiled_templates[(name, seed)] = CompiledTemplate(
+                name, _compile_object(template["fields"], Vocabulary.get(seed=seed)),
+                template.get("padding_field", "padding"))
+        return _compiled_templates[(name, seed)]
+
+
+def template_names():
+    """
+    :return: names of every template that can be passed to the DocLoader
+    """
+    return [HOTEL_TEMPLATE] + list(_templates)
+
+
+# -- Built-in templates --
+PRICES = [1000.0, 2000.0, 3000.0, 4000.0, 5000.0, 6000.0, 7000.0, 8000.0, 9000.0, 10000.0]
+
+# flat hotel rows used for the s3 files
+register_template("s3_hotel", {
+    "fields": {
+        "address": {"type": "address"},
+        "avg_ratings": {"type": "float", "min": 0.1, "max": 9.9, "digits": 1},
+        "city": {"type": "city"},
+        "country": {"type": "country"},
+        "email": {"type": "email"},
+        "free_breakfast": {"type": "int", "min": 0, "max": 1},
+        "free_parking": {"type": "int", "min": 0, "max": 1},
+        "name": {"type": "name"},
+        "phone": {"type": "choice", "values": PRICES},
+        "price": {"type": "choice", "values": PRICES},
+        "public_likes": {"type": "array", "items": {"type": "word"}, "count": 5},
+        "reviews": {"type": "array", "count": 2, "items": {"type": "object", "fields": {
+            "date": {"type": "date"},
+            "author": {"type": "name"},
+            "rating": {"type": "object", "fields": {
+                "value": {"type": "int", "min": 1, "max": 10},
+                "cleanliness": {"type": "int", "min": 1, "max": 10},
+                "overall": {"type": "int", "min": 1, "max": 10}
+            }}
+        }}},
+        "type": {"type": "constant", "value": "Hotel"},
+        "url": {"type": "url"}
+    },
+    "padding_field": "extra"
+})
+
+register_template("narrow", {
+    "fields": {
+        "key": {"type": "key"},
+        "name": {"type": "name"},
+        "value": {"type": "int", "min": 0, "max": 1000000},
+        "updated": {"type": "date"}
+    }
+})
+
+_WIDE_FIELD_TYPES = [{"type": "int", "min": 0, "max": 1000000}, {"type": "float", "min": 0, "max": 1000},
+                     {"type": "word"}, {"type": "city"}, {"type": "date"}]
+register_template("wide", {
+    "fields": dict([("key", {"type": "key"})] +
+                   [(f"field_{i}", _WIDE_FIELD_TYPES[i % len(_WIDE_FIELD_TYPES)]) for i in range(200)])
+})
+
+
+def _nested_level(depth):
+    fields = {"name": {"type": "name"}, "value": {"type": "int", "min": 0, "max": 1000}}
+    if depth:
+        fields["child"] = {"type": "object", "fields": _nested_level(depth - 1)}
+        fields["siblings"] = {"type": "array", "min_items": 1, "max_items": 2,
+                              "items": {"type": "object", "fields": {"word": {"type": "word"},
+                                                                     "date": {"type": "date"}}}}
+    return fields
+
+
+register_template("nested", {
+    "fields": dict([("key", {"type": "key"})] + list(_nested_level(8).items()))
+})
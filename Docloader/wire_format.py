@@ -0,0 +1,281 @@
+"""
+Wire formats for generated documents.
+Documents can be encoded by the generator into what each source is sent, so the encoding is done
+ahead of the send loop and the document size is matched against the encoded representation.
+"""
+import json
+import math
+import string
+from decimal import Decimal
+
+import bson
+from boto3.dynamodb.types import TypeSerializer
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+
+WIRE_FORMATS = ("bson", "dynamodb", "mysql")
+# not an encoding, documents are paired with the size drawn for them, for sources converting them on write
+SIZED = "sized"
+
+# Hotel fields stored as columns of the mysql table, in the order of the table definition
+MYSQL_COLUMNS = ("address", "avg_ratings", "city", "country", "email", "free_breakfast", "free_parking",
+                 "name", "phone", "price", "public_likes", "reviews", "type", "url")
+# columns holding a list, stored as json text
+MYSQL_JSON_COLUMNS = ("public_likes", "reviews")
+
+_serializer = TypeSerializer()
+
+
+def resize_padding(padding, length):
+    """
+    Cut or extend the padding of a document to the given length.
+    The padding is extended by repeating itself, so seeded documents stay reproducible.
+    :param padding: current padding
+    :param length: required length
+    :return: new padding
+    """
+    if length <= 0:
+        return ""
+    if length <= len(padding):
+        return padding[:length]
+    filler = padding or string.ascii_letters
+    return (padding + filler * math.ceil((length - len(padding)) / len(filler)))[:length]
+
+
+def to_bson(document, document_size, padding_field="padding"):
+    """
+    Encode a document to BSON with its padding resized so the BSON document is document_size bytes.
+    An _id is added so pymongo does not have to modify the encoded document.
+    :param document: generated document
+    :param document_size: required size in bytes
+    :param padding_field: string field resized to reach document_size, the document is only encoded
+    if it has no such field
+    :return: object of class RawBSONDocument, accepted by insert_one and insert_many
+    """
+    padding = document.get(padding_field)
+    document = dict(document, _id=document.get("_id") or ObjectId())
+    if not isinstance(padding, str):
+        return RawBSONDocument(bson.encode(document))
+    document[padding_field] = ""
+    reviews = document.get("reviews")
+    if isinstance(reviews, list):
+        document["reviews"] = reviews = list(reviews)
+    base_size = len(bson.encode(document))
+    # reviews were fitted on the json size, drop the ones that do not fit in BSON
+    while base_size > document_size and isinstance(reviews, list) and reviews:
+        review = reviews.pop()
+        # type byte, array index as a cstring, then the review document
+        base_size -= 1 + len(str(len(reviews))) + 1 + len(bson.encode(review))
+    document[padding_field] = resize_padding(padding, document_size - base_size)
+    return RawBSONDocument(bson.encode(document))
+
+
+def to_dynamodb_number(value):
+    """
+    Convert floats to Decimal, the only non integer number type accepted by boto3
+    """
+    if isinstance(value, float):
+        return Decimal(str(value))
+    elif isinstance(value, list):
+        return [to_dynamodb_number(item) for item in value]
+    elif isinstance(value, dict):
+        return {key: to_dynamodb_number(item) for key, item in value.items()}
+    return value
+
+
+def dynamodb_number_size(number):
+    """
+    Size of a dynamoDB number, one byte per two significant digits plus one byte
+    :param number: number as sent to dynamoDB, a string
+    """
+    digits = number.lstrip("-").replace(".", "")
+    if "e" in digits.lower():
+        digits = digits.lower().split("e")[0]
+    digits = digits.strip("0") or "0"
+    return math.ceil(len(digits) / 2) + 1
+
+
+def dynamodb_attribute_size(attribute):
+    """
+    Size in bytes dynamoDB accounts for a serialized attribute value
+    :param attribute: attribute value in the low level format, eg: {"S": "value"}
+    """
+    (attribute_type, value), = attribute.items()
+    if attribute_type == "S":
+        return len(value.encode("utf-8"))
+    elif attribute_type == "N":
+        return dynamodb_number_size(value)
+    elif attribute_type == "B":
+        return len(value)
+    elif attribute_type in ("BOOL", "NULL"):
+        return 1
+    elif attribute_type == "L":
+        return 3 + sum(dynamodb_attribute_size(item) + 1 for item in value)
+    elif attribute_type == "M":
+        return 3 + sum(len(key.encode("utf-8")) + dynamodb_attribute_size(item) + 1
+                       for key, item in value.items())
+    elif attribute_type == "SS":
+        return sum(len(item.encode("utf-8")) for item in value)
+    elif attribute_type == "NS":
+        return sum(dynamodb_number_size(item) for item in value)
+    elif attribute_type == "BS":
+        return sum(len(item) for item in value)
+    raise ValueError(f"Unknown dynamoDB attribute type {attribute_type}")
+
+
+def dynamodb_item_size(item):
+    """
+    Size in bytes dynamoDB accounts for a serialized item
+    :param item: attribute map in the low level format
+    """
+    return sum(len(key.encode("utf-8")) + dynamodb_attribute_size(value) for key, value in item.items())
+
+
+def to_dynamodb_value(value):
+    """
+    Convert floats to Decimal and compute the size dynamoDB accounts for the value, in a single traversal
+    :param value: python value of an attribute
+    :return: (converted value, size in bytes)
+    """
+    if isinstance(value, str):
+        return value, len(value) if value.isascii() else len(value.encode("utf-8"))
+    elif isinstance(value, bool) or value is None:
+        return value, 1
+    elif isinstance(value, float):
+        value = Decimal(str(value))
+        return value, dynamodb_number_size(str(value))
+    elif isinstance(value, (int, Decimal)):
+        return value, dynamodb_number_size(str(value))
+    elif isinstance(value, (list, tuple)):
+        items, size = [], 3
+        for item in value:
+            item, item_size = to_dynamodb_value(item)
+            items.append(item)
+            size += item_size + 1
+        return items, size
+    elif isinstance(value, dict):
+        items, size = {}, 3
+        for key, item in value.items():
+            item, item_size = to_dynamodb_value(item)
+            items[key] = item
+            size += len(key.encode("utf-8")) + item_size + 1
+        return items, size
+    # sets and binary values hold no floats
+    return value, dynamodb_attribute_size(_serializer.serialize(value))
+
+
+def to_dynamodb_document(document, document_size, padding_field="padding"):
+    """
+    Convert the floats of a document to Decimal and resize its padding so the item size dynamoDB
+    accounts for is document_size bytes. The document is traversed once, unlike measuring its json.
+    :param document: generated document
+    :param document_size: required size in bytes
+    :param padding_field: string field resized to reach document_size, the document is only converted
+    if it has no such field
+    :return: item accepted by the put_item of a dynamoDB table resource and by DynamoBatchWriter
+    """
+    padding = document.get(padding_field)
+    item, base_size = {}, 0
+    for key, value in document.items():
+        if key == padding_field and isinstance(padding, str):
+            continue
+        item[key], size = to_dynamodb_value(value)
+        base_size += len(key.encode("utf-8")) + size
+    if not isinstance(padding, str):
+        return item
+    # the padding is a string attribute, its size grows one byte per ascii character
+    base_size += len(padding_field.encode("utf-8"))
+    # reviews were fitted on the json size, drop the ones that do not fit in the item
+    reviews = item.get("reviews")
+    while base_size > document_size and isinstance(reviews, list) and reviews:
+        base_size -= to_dynamodb_value(reviews.pop())[1] + 1
+    item[padding_field] = resize_padding(padding, document_size - base_size)
+    return item
+
+
+def to_dynamodb_item(document, document_size, padding_field="padding"):
+    """
+    Serialize a document to a low level dynamoDB attribute map, with its padding resized so the
+    item size dynamoDB accounts for is document_size bytes.
+    :param document: generated document
+    :param document_size: required size in bytes
+    :param padding_field: string field resized to reach document_size
+    :return: attribute map, accepted by the put_item and batch_write_item calls of the dynamodb client
+    """
+    return {key: _serializer.serialize(value)
+            for key, value in to_dynamodb_document(document, document_size, padding_field).items()}
+
+
+def add_to_dynamodb_item(item, key, value, padding_field="padding"):
+    """
+    Add an attribute to an item returned by to_dynamodb_item, its padding is cut by the size of the
+    attribute so the item keeps the size it was generated with
+    :param item: attribute map, modified in place
+    :param key: attribute name
+    :param value: attribute value, serialized with the boto3 TypeSerializer
+    :param padding_field: string field resized to keep the item size
+    :return: the item
+    """
+    attribute = _serializer.serialize(value)
+    padding = item.get(padding_field, {}).get("S")
+    if padding is not None:
+        size = len(key.encode("utf-8")) + dynamodb_attribute_size(attribute)
+        if key in item:
+            size -= len(key.encode("utf-8")) + dynamodb_attribute_size(item[key])
+        item[padding_field] = {"S": resize_padding(padding, len(padding.encode("utf-8")) - size)}
+    item[key] = attribute
+    return item
+
+
+def to_mysql_row(document):
+    """
+    Convert a document to the values of a row of the mysql table, in MYSQL_COLUMNS order
+    :param document: generated document
+    :return: tuple of column values
+    """
+    try:
+        return tuple(json.dumps(document[column]) if column in MYSQL_JSON_COLUMNS else document[column]
+                     for column in MYSQL_COLUMNS)
+    except KeyError as err:
+        raise ValueError(f"document has no {err} field, mysql rows need the hotel or s3_hotel template")
+
+
+def encode_batch(documents, wire_format, document_size, padding_field="padding"):
+    """
+    Encode a batch of generated documents to the given wire format
+    :param documents: list of generated documents
+    :param wire_format: one of WIRE_FORMATS, or SIZED for (document, document size) pairs
+    :param document_size: required size of each document in bytes, or a list with the size of every
+    document. Ignored for mysql rows
+    :param padding_field: string field of the documents resized to reach their size
+    :return: list of encoded documents
+    """
+    document_sizes = document_size if isinstance(document_size, list) else [document_size] * len(documents)
+    if wire_format == "bson":
+        return [to_bson(document, size, padding_field) for document, size in zip(documents, document_sizes)]
+    elif wire_format == "dynamodb":
+        return [to_dynamodb_item(document, size, padding_field)
+                for document, size in zip(documents, document_sizes)]
+    elif wire_format == "mysql":
+        return [to_mysql_row(document) for document in documents]
+    elif wire_format == SIZED:
+        return list(zip(documents, document_sizes))
+    raise ValueError(f"wire_format must be one of {WIRE_FORMATS}")
+
+
+def to_marshallable(encoded_documents, wire_format):
+    """
+    Convert an encoded batch to plain values that marshal can send back from a generator process
+    """
+    if wire_format == "bson":
+        return [document.raw for document in encoded_documents]
+    return encoded_documents
+
+
+def from_marshallable(encoded_documents, wire_format):
+    """
+    Reverse of to_marshallable
+    """
+    if wire_format == "bson":
+        return [RawBSONDocument(raw) for raw in encoded_documents]
+    return encoded_documents
@@ -0,0 +1,218 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import BotoCoreError, ClientError
+
+from SDKs.DynamoDB.dynamo_concurrency import AIMDConcurrencyController
+
+
+class DynamoBatchWriter:
+    """
+    Streams writes to a dynamoDB table as full BatchWriteItem calls of 25 requests.
+    One writer is meant to be shared by every thread writing to the table, requests from all of them
+    are accumulated into the same batches, which are sent by a pool of sender threads.
+    Unprocessed items and throttled calls are retried with jittered exponential backoff.
+    Requests on the same key within a batch are de-duplicated, the last one is kept, as dynamoDB
+    rejects batches with duplicate keys.
+    The number of calls in flight is adapted to throttling by an AIMDConcurrencyController.
+    :params:
+    -client: low level dynamoDB client
+    -table_name: name of the table
+    -num_threads: threads sending batches, the highest concurrency the controller can reach. Default is 8
+    -max_retries: retries of a batch before its remaining requests are dropped. Default is 10
+    -base_backoff: backoff before the first retry in seconds, doubled on every retry. Default is 0.05
+    -max_backoff: largest backoff in seconds. Default is 5
+    -concurrency_controller: Default is an AIMDConcurrencyController starting at 4 calls in flight
+    -key_attributes: primary key attributes of the table. Default is read with DescribeTable on the first request
+    """
+    MAX_BATCH_SIZE = 25
+    RETRYABLE_ERRORS = ("ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded",
+                        "InternalServerError", "ServiceUnavailable")
+
+    def __init__(self, client, table_name, num_threads=8, max_retries=10, base_backoff=0.05, max_backoff=5,
+                 concurrency_controller=None, key_attributes=None):
+        self.client = client
+        self.concurrency_controller = concurrency_controller or AIMDConcurrencyController(
+            initial_concurrency=min(4, num_threads), max_concurrency=num_threads)
+        self.table_name = table_name
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.serializer = TypeSerializer()
+        self.key_attributes = tuple(key_attributes) if key_attributes else None
+        self.lock = threading.Lock()
+        # requests of the batch being filled, by the key of their item
+        self.requests = {}
+        self.futures = set()
+        self.executor = ThreadPoolExecutor(max_workers=num_threads)
+        # bounds the batches queued for the senders, so callers block instead of buffering without limit
+        self.batch_slots = threading.BoundedSemaphore(num_threads * 2)
+        self.start_time = None
+        self.items_written = 0
+        self.items_failed = 0
+        self.batches_sent = 0
+        self.retries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _serialize(self, item):
+        return {key: self.serializer.serialize(value) for key, value in item.items()}
+
+    def put_item(self, item, serialized=False):
+        """
+        Queue a put of the item
+        :param item: item with python values, floats have to be converted to str or Decimal
+        :param serialized: the item is already in the low level attribute map format
+        """
+        self._add_request({"PutRequest": {"Item": item if serialized else self._serialize(item)}})
+
+    def delete_item(self, key, serialized=False):
+        """
+        Queue a delete of the item with the given key
+        :param key: primary key of the item, eg: {"id": "value"}
+        :param serialized: the key is already in the low level attribute map format
+        """
+        self._add_request({"DeleteRequest": {"Key": key if serialized else self._serialize(key)}})
+
+    def _get_key_attributes(self):
+        if self.key_attributes is None:
+            try:
+                key_schema = self.client.describe_table(TableName=self.table_name)['Table']['KeySchema']
+                self.key_attributes = tuple(key['AttributeName'] for key in key_schema)
+            except (BotoCoreError, ClientError) as err:
+                logging.error(f"Couldn't read the key schema of table {self.table_name}, requests are not "
+                              f"de-duplicated: {err}")
+                self.key_attributes = ()
+        return self.key_attributes
+
+    def _request_key(self, request):
+        item = request["PutRequest"]["Item"] if "PutRequest" in request else request["DeleteRequest"]["Key"]
+        key_attributes = self._get_key_attributes()
+        if not key_attributes:
+            return id(request)
+        # key attributes are S, N or B values, whose (type, value) pair is hashable
+        return tuple(next(iter(item[attribute].items())) if attribute in item else None
+                     for attribute in key_attributes)
+
+    def _add_request(self, request):
+        key = self._request_key(request)
+        with self.lock:
+            if self.start_time is None:
+                self.start_time = time.time()
+            # a later request on the same key replaces the queued one, like boto3's overwrite_by_pkeys
+            self.requests.pop(key, None)
+            self.requests[key] = request
+            if len(self.requests) < self.MAX_BATCH_SIZE:
+                return
+            batch, self.requests = list(self.requests.values()), {}
+        self._submit(batch)
+
+    def _submit(self, batch):
+        self.batch_slots.acquire()
+        future = self.executor.submit(self._send, batch)
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self._batch_done)
+
+    def _batch_done(self, future):
+        with self.lock:
+            self.futures.discard(future)
+        self.batch_slots.release()
+
+    def _send(self, batch):
+        """
+        Send a batch, retrying its unprocessed requests until they are all written or retries run out
+        """
+        requests = batch
+        attempt = 0
+        while requests:
+            written = 0
+            throttled = False
+            self.concurrency_controller.acquire()
+            try:
+                response = self.client.batch_write_item(RequestItems={self.table_name: requests})
+                unprocessed = response.get("UnprocessedItems", {}).get(self.table_name, [])
+                written = len(requests) - len(unprocessed)
+                # dynamoDB returns unprocessed items when the table is throttling
+                throttled = bool(unprocessed)
+                requests = unprocessed
+            except ClientError as err:
+                throttled = AIMDConcurrencyController.is_throttling_error(err)
+                if err.response['Error']['Code'] not in self.RETRYABLE_ERRORS:
+                    logging.error("Couldn't write batch to table %s. Here's why: %s: %s", self.table_name,
+                                  err.response['Error']['Code'], err.response['Error']['Message'])
+                    self._record(failed=len(requests))
+                    return
+            except BotoCoreError as err:
+                logging.error(f"Couldn't write batch to table {self.table_name}. Here's why: {err}")
+                self._record(failed=len(requests))
+                return
+            finally:
+                self.concurrency_controller.release(throttled)
+            self._record(written=written)
+            if requests:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logging.error(f"Dropping {len(requests)} unprocessed requests on table {self.table_name} "
+                                  f"after {self.max_retries} retries")
+                    self._record(failed=len(requests))
+                    return
+                self._record(retried=True)
+                time.sleep(random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt)))
+
+    def _record(self, written=0, failed=0, retried=False):
+        with self.lock:
+            self.items_written += written
+            self.items_failed += failed
+            if written or failed:
+                self.batches_sent += 1
+            if retried:
+                self.retries += 1
+
+    def flush(self):
+        """
+        Send the requests queued so far and wait for every batch to be written
+        """
+        with self.lock:
+            batch, self.requests = list(self.requests.values()), {}
+        if batch:
+            self._submit(batch)
+        with self.lock:
+            futures = list(self.futures)
+        wait(futures)
+
+    def close(self):
+        """
+        Flush and stop the sender threads
+        """
+        self.flush()
+        self.executor.shutdown()
+        logging.info(f"Batch writer on {self.table_name}: {self.stats()}")
+
+    def items_per_sec(self):
+        """
+        :return: items written per second since the first request was queued
+        """
+        if self.start_time is None:
+            return 0.0
+        return self.items_written / max(time.time() - self.start_time, 1e-9)
+
+    def stats(self):
+        """
+        :return: dictionary with the items written and failed, batches sent, retries, items/sec,
+        current concurrency and throttle rate
+        """
+        with self.lock:
+            stats = {"items_written": self.items_written, "items_failed": self.items_failed,
+                     "batches_sent": self.batches_sent, "retries": self.retries}
+        stats["items_per_sec"] = self.items_per_sec()
+        stats.update(self.concurrency_controller.stats())
+        return stats
@@ -0,0 +1,85 @@
+import collections
+import threading
+import time
+
+
+class AIMDConcurrencyController:
+    """
+    Limits the number of dynamoDB calls in flight with additive increase, multiplicative decrease.
+    The limit grows by `increase` every round trip of successful calls and is multiplied by
+    decrease_factor when a call is throttled, so writers settle at the rate the table sustains.
+    :params:
+    -initial_concurrency: Default is 4
+    -min_concurrency: Default is 1
+    -max_concurrency: Default is 32
+    -increase: calls added to the limit per round trip without throttling. Default is 1
+    -decrease_factor: factor applied to the limit on throttling. Default is 0.5
+    -cooldown: seconds after a decrease during which throttles of calls already in flight
+    do not decrease the limit again. Default is 1
+    -window: number of recent calls the throttle rate is computed on. Default is 1000
+    """
+    THROTTLING_ERRORS = ("ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded")
+
+    def __init__(self, initial_concurrency=4, min_concurrency=1, max_concurrency=32, increase=1,
+                 decrease_factor=0.5, cooldown=1, window=1000):
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.concurrency = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.recent_calls = collections.deque(maxlen=window)
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait for a free slot before making a call
+        """
+        with self.condition:
+            while self.in_flight >= int(self.concurrency):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        """
+        Release the slot of a finished call
+        :param throttled: the call was throttled, or returned unprocessed items
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.recent_calls.append(throttled)
+            now = time.monotonic()
+            if throttled:
+                if now - self.last_decrease >= self.cooldown:
+                    self.concurrency = max(self.min_concurrency, self.concurrency * self.decrease_factor)
+                    self.last_decrease = now
+            else:
+                # spread over the calls of a round trip, so the limit grows by `increase` per round trip
+                self.concurrency = min(self.max_concurrency, self.concurrency + self.increase / self.concurrency)
+            self.condition.notify_all()
+
+    @classmethod
+    def is_throttling_error(cls, err):
+        """
+        :param err: botocore ClientError
+        """
+        return err.response['Error']['Code'] in cls.THROTTLING_ERRORS
+
+    def current_concurrency(self):
+        return int(self.concurrency)
+
+    def throttle_rate(self):
+        """
+        :return: fraction of the recent calls that were throttled
+        """
+        with self.condition:
+            return sum(self.recent_calls) / len(self.recent_calls) if self.recent_calls else 0.0
+
+    def stats(self):
+        """
+        :return: dictionary with the current concurrency, calls in flight and throttle rate
+        """
+        return {"concurrency": self.current_concurrency(), "in_flight": self.in_flight,
+                "throttle_rate": self.throttle_rate()}
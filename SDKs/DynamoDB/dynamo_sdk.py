@@ -1,21 +1,91 @@
 import boto3
+import functools
 import logging
+import queue
+import random
+import threading
+import time
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+
+from SDKs.DynamoDB.dynamo_batch_writer import DynamoBatchWriter
+
+
+@functools.lru_cache(maxsize=1024)
+def _partiql_statement(table_name, operation, attributes, key_attributes):
+    where = " AND ".join(f'"{attribute}"=?' for attribute in key_attributes)
+    if operation == "insert":
+        values = ", ".join(f"'{attribute}': ?" for attribute in attributes)
+        return f'INSERT INTO "{table_name}" VALUE {{{values}}}'
+    elif operation == "update":
+        assignments = ", ".join(f'"{attribute}"=?' for attribute in attributes)
+        return f'UPDATE "{table_name}" SET {assignments} WHERE {where}'
+    elif operation == "delete":
+        return f'DELETE FROM "{table_name}" WHERE {where}'
+    elif operation == "select":
+        projection = ", ".join(f'"{attribute}"' for attribute in attributes) or "*"
+        return f'SELECT {projection} FROM "{table_name}"' + (f" WHERE {where}" if where else "")
+    raise ValueError(f"Unknown partiql operation {operation}")
 
 
 class DynamoDb:
     """
     SDK class for dynamoDb, Helps in managing dynamoDB entities
     """
+    # segments scanned in parallel by default by the parallel scans
+    DEFAULT_SCAN_SEGMENTS = 8
+    # largest number of keys of a BatchGetItem call
+    MAX_BATCH_GET_SIZE = 100
+    # largest number of statements of a BatchExecuteStatement call
+    MAX_PARTIQL_BATCH_SIZE = 25
+    # errors of a statement of a BatchExecuteStatement call which are retried
+    RETRYABLE_PARTIQL_ERRORS = ("ProvisionedThroughputExceeded", "RequestLimitExceeded", "ThrottlingError",
+                                "InternalServerError", "TransactionConflict")
+    # HTTP connections kept by each client, botocore keeps 10 by default
+    DEFAULT_MAX_POOL_CONNECTIONS = 50
+    # (max_pool_connections, session, client, resource class, resource client) shared by every DynamoDb object
+    # of the process, keyed by credentials and region, so warm keep-alive connections are reused. Clients are
+    # thread safe, resources are not, so each thread builds its own resource on top of the shared resource client.
+    # Resources register the boto3 type serializer on their client, so the low level client is never given to one
+    _connections = {}
+    _connections_lock = threading.Lock()
 
-    def __init__(self, access_key, secret_key, region, session_token=None, table=None):
+    def __init__(self, access_key, secret_key, region, session_token=None, table=None, max_pool_connections=None,
+                 max_attempts=None):
+        """
+        :param max_pool_connections: HTTP connections of the client, match it to the number of threads
+        using the object. Default is DEFAULT_MAX_POOL_CONNECTIONS
+        :param max_attempts: attempts of every call by botocore, including the first one. 1 leaves throttling
+        to the caller, eg: to an AIMDConcurrencyController. Default is the botocore retry policy
+        """
         logging.basicConfig()
         self.logger = logging.getLogger("AWS_Util")
-        self.create_session(access_key, secret_key, region, session_token)
-        self.client = self.create_service_client(service_name="dynamodb", region=region)
-        self.dyn_resource = self.create_service_resource(resource_name="dynamodb")
+        self.connection_args = {"access_key": access_key, "secret_key": secret_key, "region": region,
+                                "session_token": session_token}
+        self.max_pool_connections = max(max_pool_connections or 0, self.DEFAULT_MAX_POOL_CONNECTIONS)
+        cache_key = (access_key, secret_key, session_token, region, max_attempts)
+        with DynamoDb._connections_lock:
+            cached = DynamoDb._connections.get(cache_key)
+            # a client with a smaller pool is replaced, so the pool only grows
+            if cached and cached[0] >= self.max_pool_connections:
+                _, self.aws_session, self.client, self.resource_class, self.resource_client = cached
+            else:
+                config = Config(max_pool_connections=self.max_pool_connections)
+                if max_attempts:
+                    config = Config(max_pool_connections=self.max_pool_connections,
+                                    retries={"total_max_attempts": max_attempts, "mode": "standard"})
+                self.create_session(access_key, secret_key, region, session_token)
+                self.client = self.create_service_client(service_name="dynamodb", region=region, config=config)
+                resource = self.create_service_resource(resource_name="dynamodb", config=config)
+                self.resource_class = type(resource) if resource else None
+                self.resource_client = resource.meta.client if resource else None
+                if self.client and self.resource_class:
+                    DynamoDb._connections[cache_key] = (self.max_pool_connections, self.aws_session, self.client,
+                                                        self.resource_class, self.resource_client)
 
-        self.table = self.dyn_resource.Table(name=table) if table else None
+        self.local = threading.local()
         self.table_name = table
         self.region = region
 
@@ -41,30 +111,66 @@ class DynamoDb:
         except Exception as e:
             self.logger.error(e)
 
-    def create_service_client(self, service_name, region=None):
+    def create_service_client(self, service_name, region=None, config=None):
         """
         Create a low level client for the service specified.
         If a region is not specified, the client is created in the default region (us-east-1).
         :param service_name: name of the service for which the client has to be created
         :param region: region in which the client has to created.
+        :param config: botocore Config of the client
         """
         try:
             if region is None:
-                return self.aws_session.client(service_name)
+                return self.aws_session.client(service_name, config=config)
             else:
-                return self.aws_session.client(service_name, region_name=region)
+                return self.aws_session.client(service_name, region_name=region, config=config)
         except ClientError as e:
             self.logger.error(e)
 
-    def create_service_resource(self, resource_name):
+    def create_service_resource(self, resource_name, config=None):
         """
         Create a service resource object, to access resources related to service.
+        :param config: botocore Config of the client of the resource
         """
         try:
-            return self.aws_session.resource(resource_name)
+            return self.aws_session.resource(resource_name, config=config)
         except Exception as e:
             self.logger.error(e)
 
+    @property
+    def dyn_resource(self):
+        """
+        DynamoDB service resource of the calling thread, built on the shared resource client
+        """
+        if getattr(self.local, "resource", None) is None:
+            self.local.resource = self.resource_class(client=self.resource_client)
+            self.local.tables = {}
+        return self.local.resource
+
+    @property
+    def table(self):
+        """
+        Table resource of the calling thread, None if the object has no table
+        """
+        if not self.table_name:
+            return None
+        resource = self.dyn_resource
+        if self.table_name not in self.local.tables:
+            self.local.tables[self.table_name] = resource.Table(name=self.table_name)
+        return self.local.tables[self.table_name]
+
+    @table.setter
+    def table(self, table):
+        self.table_name = table.name if table else None
+
+    @classmethod
+    def clear_connection_cache(cls):
+        """
+        Drop the cached sessions and clients, eg: after credentials are rotated
+        """
+        with cls._connections_lock:
+            cls._connections.clear()
+
     def create_table(self, table_name, key_schema,
                      attribute_definitions, read_write_capacity_units, on_demand=True, **params):
         """
@@ -154,6 +260,41 @@ class DynamoDb:
                 err.response['Error']['Code'], err.response['Error']['Message'])
             raise
 
+    def batch_get_items(self, keys, projection_expression=None, consistent_read=False, max_retries=5):
+        """
+        Retrieve items with BatchGetItem calls of up to MAX_BATCH_GET_SIZE keys.
+        Unprocessed keys are retried with jittered exponential backoff.
+        :param keys: list of distinct primary keys, eg: [{"id": "value"}]
+        :param projection_expression: attributes to retrieve, all of them by default
+        :param consistent_read: use strongly consistent reads
+        :param max_retries: retries of the unprocessed keys of a call before they are dropped
+        :return: list of the items found
+        """
+        items = []
+        for start in range(0, len(keys), self.MAX_BATCH_GET_SIZE):
+            request = {"Keys": keys[start:start + self.MAX_BATCH_GET_SIZE], "ConsistentRead": consistent_read}
+            if projection_expression:
+                request["ProjectionExpression"] = projection_expression
+            attempt = 0
+            while request:
+                try:
+                    response = self.dyn_resource.batch_get_item(RequestItems={self.table_name: request})
+                except ClientError as err:
+                    logging.error(
+                        "Couldn't get items from table %s. Here's why: %s: %s", self.table_name,
+                        err.response['Error']['Code'], err.response['Error']['Message'])
+                    raise
+                items.extend(response["Responses"].get(self.table_name, []))
+                request = response.get("UnprocessedKeys", {}).get(self.table_name)
+                if request:
+                    attempt += 1
+                    if attempt > max_retries:
+                        logging.error(f"Dropping {len(request['Keys'])} unprocessed keys on table "
+                                      f"{self.table_name} after {max_retries} retries")
+                        break
+                    time.sleep(random.uniform(0, min(5, 0.05 * 2 ** attempt)))
+        return items
+
     def add_item(self, item):
         """
         Put an item in the dynamoDB table
@@ -167,26 +308,45 @@ class DynamoDb:
                 err.response['Error']['Code'], err.response['Error']['Message'])
             raise
 
+    def add_serialized_item(self, item):
+        """
+        Put an item already serialized to the low level attribute map format in the dynamoDB table
+        :param item: eg: {"name": {"S": "value"}}
+        """
+        try:
+            self.client.put_item(TableName=self.table_name, Item=item)
+        except ClientError as err:
+            logging.error(
+                "Couldn't add item: Error: %s: %s",
+                err.response['Error']['Code'], err.response['Error']['Message'])
+            raise
+
     def update_item(self, item_key, changed_object_json):
         """
-        Update an item already present in the dynamoDB table
+        Update some attributes of an item already present in the dynamoDB table, the other attributes
+        are left as they are
         :param item_key:
-        :param changed_object_json:
-        :return:
+        :param changed_object_json: attributes to set, floats have to be converted to str or Decimal
+        :return: the updated attributes
         """
         update_params = {
-            'Key': item_key
+            'Key': item_key,
+            'ReturnValues': 'UPDATED_NEW'
         }
-        update_expression = "set "
+        set_clauses = []
+        expression_attribute_names = {}
         expression_attribute_values = {}
-        for key, value in changed_object_json.items():
-            update_expression = update_expression + f"info.{key}=:{key},"
-            expression_attribute_values[':' + key] = value
-        update_params['UpdateExpression'] = update_expression
+        # attribute names go through placeholders, so reserved words like "name" can be updated
+        for index, (key, value) in enumerate(changed_object_json.items()):
+            set_clauses.append(f"#attr{index} = :value{index}")
+            expression_attribute_names[f'#attr{index}'] = key
+            expression_attribute_values[f':value{index}'] = value
+        update_params['UpdateExpression'] = "SET " + ", ".join(set_clauses)
+        update_params['ExpressionAttributeNames'] = expression_attribute_names
         update_params['ExpressionAttributeValues'] = expression_attribute_values
         try:
-            response = self.table.update_tem(**update_params)
-            return response['Attributes']
+            response = self.table.update_item(**update_params)
+            return response.get('Attributes')
         except ClientError as err:
             logging.error(
                 "Couldn't update item %s in table %s. Here's why: %s: %s",
@@ -282,26 +442,103 @@ class DynamoDb:
             raise
         return items
 
-    def get_live_item_count(self):
-        doc_count = 0
-        response = self.client.scan(
-            TableName=self.table_name,
-            Select='COUNT',
-            ConsistentRead=True
-        )
-
-        doc_count += response['Count']
-
-        while 'LastEvaluatedKey' in response:
-            response = self.client.scan(
-                TableName=self.table_name,
-                Select='COUNT',
-                ConsistentRead=True,
-                ExclusiveStartKey=response['LastEvaluatedKey']
-            )
-            doc_count += response['Count']
+    def scan_segment(self, segment, total_segments, **scan_kwargs):
+        """
+        Scan one segment of a parallel scan of the table
+        :param segment: segment to scan, from 0 to total_segments - 1
+        :param total_segments: number of segments the table is split into
+        :param scan_kwargs: any other argument of the scan call of the low level client
+        :return: generator of the response pages of the segment
+        """
+        while True:
+            response = self.client.scan(TableName=self.table_name, Segment=segment,
+                                        TotalSegments=total_segments, **scan_kwargs)
+            yield response
+            if 'LastEvaluatedKey' not in response:
+                return
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
-        return doc_count
+    def parallel_scan(self, total_segments=None, **scan_kwargs):
+        """
+        Scan the table with one thread per segment
+        :param total_segments: segments scanned in parallel. Default is DEFAULT_SCAN_SEGMENTS
+        :param scan_kwargs: any other argument of the scan call of the low level client
+        :return: generator of the response pages of every segment, in the order they arrive
+        """
+        total_segments = total_segments or self.DEFAULT_SCAN_SEGMENTS
+        pages = queue.Queue(maxsize=total_segments * 2)
+        stop = threading.Event()
+
+        def scan(segment):
+            try:
+                for page in self.scan_segment(segment, total_segments, **scan_kwargs):
+                    while not stop.is_set():
+                        try:
+                            pages.put(page, timeout=1)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop.is_set():
+                        return
+            finally:
+                pages.put(None)
+
+        executor = ThreadPoolExecutor(max_workers=total_segments)
+        futures = [executor.submit(scan, segment) for segment in range(total_segments)]
+        try:
+            finished = 0
+            while finished < total_segments:
+                page = pages.get()
+                if page is None:
+                    finished += 1
+                else:
+                    yield page
+            for future in futures:
+                future.result()
+        finally:
+            stop.set()
+            # unblock the segments waiting to put their last page
+            while any(not future.done() for future in futures):
+                try:
+                    pages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            executor.shutdown()
+
+    def scan_key_values(self, key_attribute, total_segments=None, consistent_read=False):
+        """
+        Read the value of the key attribute of every item with a parallel scan
+        :param key_attribute: name of the primary key attribute
+        :param total_segments: segments scanned in parallel. Default is DEFAULT_SCAN_SEGMENTS
+        :param consistent_read: use a strongly consistent scan, so items just deleted are not returned
+        :return: generator of key values
+        """
+        deserializer = TypeDeserializer()
+        for page in self.parallel_scan(total_segments, ProjectionExpression='#key_attr',
+                                       ExpressionAttributeNames={'#key_attr': key_attribute},
+                                       ConsistentRead=consistent_read):
+            for item in page.get('Items', []):
+                if key_attribute in item:
+                    yield deserializer.deserialize(item[key_attribute])
+
+    def get_live_item_count(self, total_segments=None, approximate=False):
+        """
+        Count the items of the table with a strongly consistent parallel scan
+        :param total_segments: segments scanned in parallel. Default is DEFAULT_SCAN_SEGMENTS
+        :param approximate: return the ItemCount of DescribeTable instead, which costs no read capacity
+        but is only refreshed by dynamoDB about every six hours
+        :return: number of items
+        """
+        if approximate:
+            return self.client.describe_table(TableName=self.table_name)['Table']['ItemCount']
+        total_segments = total_segments or self.DEFAULT_SCAN_SEGMENTS
+
+        def count_segment(segment):
+            return sum(page['Count'] for page in self.scan_segment(segment, total_segments, Select='COUNT',
+                                                                   ConsistentRead=True))
+
+        with ThreadPoolExecutor(max_workers=total_segments) as executor:
+            return sum(executor.map(count_segment, range(total_segments)))
 
     def run_partiql(self, statement, params):
         """
@@ -325,6 +562,122 @@ class DynamoDb:
                     err.response['Error']['Code'], err.response['Error']['Message'])
             raise
 
+    def paginate_partiql(self, statement, params=None, consistent_read=False, limit=None):
+        """
+        Run a dynamoDB partiql select, following NextToken so large results are read page by page
+        :param statement: partiql statement
+        :param params: list of the values of the ? of the statement
+        :param consistent_read: use strongly consistent reads
+        :param limit: items evaluated per page
+        :return: generator of the items
+        """
+        request = {"Statement": statement, "ConsistentRead": consistent_read}
+        if params:
+            request["Parameters"] = params
+        if limit:
+            request["Limit"] = limit
+        while True:
+            output = self._execute_partiql(request)
+            yield from output.get("Items", [])
+            if not output.get("NextToken"):
+                return
+            request["NextToken"] = output["NextToken"]
+
+    def _execute_partiql(self, request):
+        try:
+            return self.dyn_resource.meta.client.execute_statement(**request)
+        except ClientError as err:
+            logging.error(
+                "Couldn't execute PartiQL '%s'. Here's why: %s: %s", request["Statement"],
+                err.response['Error']['Code'], err.response['Error']['Message'])
+            raise
+
+    def run_partiql_batch(self, statements, num_threads=1, max_retries=5):
+        """
+        Run dynamoDB partiql statements with BatchExecuteStatement calls of up to 25 statements.
+        Statements failing with a throttling or transient error are retried with jittered exponential backoff.
+        :param statements: list of (statement, params) tuples, params being the list of values of the ?
+        of the statement, eg: from partiql_statement
+        :param num_threads: batches sent in parallel
+        :param max_retries: retries of the failed statements of a batch
+        :return: list with the response of every statement, in order. A response has the 'Item' of selects
+        or the 'Error' of a failed statement
+        """
+        batches = [statements[start:start + self.MAX_PARTIQL_BATCH_SIZE]
+                   for start in range(0, len(statements), self.MAX_PARTIQL_BATCH_SIZE)]
+        if num_threads > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                results = list(executor.map(lambda batch: self._run_partiql_batch(batch, max_retries), batches))
+        else:
+            results = [self._run_partiql_batch(batch, max_retries) for batch in batches]
+        return [response for result in results for response in result]
+
+    def _run_partiql_batch(self, statements, max_retries):
+        responses = [None] * len(statements)
+        pending = list(range(len(statements)))
+        attempt = 0
+        while pending:
+            request = []
+            for position in pending:
+                statement, params = statements[position]
+                request.append({"Statement": statement, "Parameters": params} if params else
+                               {"Statement": statement})
+            try:
+                output = self.dyn_resource.meta.client.batch_execute_statement(Statements=request)
+            except ClientError as err:
+                logging.error(
+                    "Couldn't execute PartiQL batch on table %s. Here's why: %s: %s", self.table_name,
+                    err.response['Error']['Code'], err.response['Error']['Message'])
+                raise
+            retry = []
+            for position, response in zip(pending, output["Responses"]):
+                responses[position] = response
+                if response.get("Error", {}).get("Code") in self.RETRYABLE_PARTIQL_ERRORS:
+                    retry.append(position)
+            pending = retry
+            if pending:
+                attempt += 1
+                if attempt > max_retries:
+                    logging.error(f"{len(pending)} PartiQL statements on table {self.table_name} failed "
+                                  f"after {max_retries} retries")
+                    break
+                time.sleep(random.uniform(0, min(5, 0.05 * 2 ** attempt)))
+        return responses
+
+    def partiql_statement(self, operation, attributes=(), key_attributes=()):
+        """
+        Parameterized partiql statement on the table, statements are cached so the ones of repeated
+        operations are only built once
+        :param operation: insert, update, delete or select
+        :param attributes: attributes inserted or set, in the order of the params
+        :param key_attributes: attributes of the WHERE clause, after the attributes in the params
+        :return: statement, eg: UPDATE "table" SET "price"=? WHERE "id"=?
+        """
+        return _partiql_statement(self.table_name, operation, tuple(attributes), tuple(key_attributes))
+
+    def update_items_partiql(self, key_attribute, updates, num_threads=1):
+        """
+        Set attributes of items with batched partiql updates
+        :param key_attribute: primary key attribute
+        :param updates: list of (key value, dictionary of attribute to value) tuples
+        :return: list of the responses of the statements
+        """
+        statements = []
+        for key, changes in updates:
+            statement = self.partiql_statement("update", changes, (key_attribute,))
+            statements.append((statement, list(changes.values()) + [key]))
+        return self.run_partiql_batch(statements, num_threads)
+
+    def delete_items_partiql(self, key_attribute, keys, num_threads=1):
+        """
+        Delete items with batched partiql deletes
+        :param key_attribute: primary key attribute
+        :param keys: list of key values
+        :return: list of the responses of the statements
+        """
+        statement = self.partiql_statement("delete", key_attributes=(key_attribute,))
+        return self.run_partiql_batch([(statement, [key]) for key in keys], num_threads)
+
     def write_batch(self, items):
         """
         Write to dynamoDB in batches
@@ -340,6 +693,23 @@ class DynamoDb:
                 err.response['Error']['Code'], err.response['Error']['Message'])
             raise
 
+    def get_batch_writer(self, num_threads=32, max_retries=10, key_attributes=None):
+        """
+        Create a writer batching puts and deletes on the table into 25 item BatchWriteItem calls.
+        Share it between all the threads writing to the table and close it once done.
+        :param num_threads: threads sending batches, the concurrency is adapted to throttling up to it
+        :param max_retries: retries of a batch with unprocessed items or throttled
+        :param key_attributes: primary key attributes, requests on the same key are de-duplicated.
+        Default is read from the table
+        :return: object of class DynamoBatchWriter
+        """
+        # botocore does not retry the calls of the writer, so its concurrency controller sees the throttling
+        writer_client = DynamoDb(**self.connection_args, table=self.table_name,
+                                 max_pool_connections=max(num_threads, self.max_pool_connections),
+                                 max_attempts=1).client
+        return DynamoBatchWriter(writer_client, self.table_name, num_threads=num_threads, max_retries=max_retries,
+                                 key_attributes=key_attributes)
+
     def enable_image_streaming(self, StreamViewType="NEW_IMAGE", table_name=None):
         try:
             if not self.table and not table_name:
@@ -11,9 +11,12 @@ class MongoConfig:
             password (str): The password for authentication (optional).
             database_name (str): The name of the MongoDB database to connect to.
             atlas_url (str) : If you want to run using MongoDB Atlas
+            max_pool_size (int) : Largest number of connections of the client (optional, pymongo default is 100).
+            min_pool_size (int) : Connections the client keeps open even when idle (optional, pymongo default is 0).
     """
 
-    def __init__(self, mongo_ip, port, username, password, database_name, atlas_url=None):
+    def __init__(self, mongo_ip, port, username, password, database_name, atlas_url=None, max_pool_size=None,
+                 min_pool_size=None):
         """
         Initialize a new MongoConfig instance with the provided connection settings.
         """
@@ -23,3 +26,5 @@ class MongoConfig:
         self.password = password
         self.database_name = database_name
         self.atlas_url = atlas_url
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
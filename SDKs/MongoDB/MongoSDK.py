@@ -1,5 +1,7 @@
 import logging
+import threading
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 
 from .MongoConfig import MongoConfig
 
@@ -19,11 +21,18 @@ class MongoSDK(MongoConfig):
          username (str): The username for authentication (optional).
          password (str): The password for authentication (optional).
          database_name (str): The name of the MongoDB database to connect to.
+         uri (str): The connection URI, MongoSDK instances with the same URI share one MongoClient.
      """
+    # MongoClient objects shared by every MongoSDK of the process, keyed by connection URI,
+    # with the number of MongoSDK instances using each of them
+    _clients = {}
+    _clients_lock = threading.Lock()
 
     def __init__(self, config):
         """
              Initialize a new MongoSDK instance with the provided connection settings.
+             The MongoClient of the URI is reused if another instance already opened it, its pool options are
+             the ones of the config of the first instance.
         """
         self.mongo_ip = config.mongo_ip
         self.port = config.port
@@ -34,15 +43,20 @@ class MongoSDK(MongoConfig):
         super().__init__(self.mongo_ip, self.port,
                          self.username, self.password, self.database_name)
 
-        if config.atlas_url:
-            self.client = MongoClient(config.atlas_url, tlsAllowInvalidCertificates=True)
+        options = {}
+        if getattr(config, "max_pool_size", None):
+            options["maxPoolSize"] = config.max_pool_size
+        if getattr(config, "min_pool_size", None):
+            options["minPoolSize"] = config.min_pool_size
+        if getattr(config, "atlas_url", None):
+            self.uri = config.atlas_url
+            options["tlsAllowInvalidCertificates"] = True
+        # create a mongoDB client
+        elif self.username and self.password:
+            self.uri = f"mongodb://{self.username}:{self.password}@{self.mongo_ip}:{self.port}/{self.database_name}"
         else:
-            # create a mongoDB client
-            if self.username and self.password:
-                self.client = MongoClient(
-                    f"mongodb://{self.username}:{self.password}@{self.mongo_ip}:{self.port}/{self.database_name}")
-            else:
-                self.client = MongoClient(f"mongodb://{self.mongo_ip}:{self.port}")
+            self.uri = f"mongodb://{self.mongo_ip}:{self.port}"
+        self.client = self.acquire_client(self.uri, **options)
 
         self.db = self.client[self.database_name]
 
@@ -57,11 +71,42 @@ class MongoSDK(MongoConfig):
             self.log.addHandler(handler)
             self.log.propagate = False
 
+    @classmethod
+    def acquire_client(cls, uri, **options):
+        """
+            Get the shared MongoClient of the URI, it is created with the options if no instance uses it yet.
+
+            Returns:
+                pymongo.MongoClient: The client, to be released with release_client.
+        """
+        with cls._clients_lock:
+            entry = cls._clients.get(uri)
+            if entry is None:
+                entry = cls._clients[uri] = [MongoClient(uri, **options), 0]
+            entry[1] += 1
+            return entry[0]
+
+    @classmethod
+    def release_client(cls, uri):
+        """
+            Release a client returned by acquire_client, it is closed once no instance uses it.
+        """
+        with cls._clients_lock:
+            entry = cls._clients.get(uri)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del cls._clients[uri]
+                entry[0].close()
+
     def close_mongoDB_connection(self):
         """
-            Close the MongoDB connection
+            Release the MongoDB connection, the shared client is closed once no instance uses it
         """
-        self.client.close()
+        if self.client is not None:
+            self.client = None
+            self.release_client(self.uri)
 
     def drop_database(self, database_name):
         self.client.drop_database(database_name)
@@ -93,14 +138,21 @@ class MongoSDK(MongoConfig):
                 collection_name (str): The name of the collection to insert the documents into.
                 data_to_insert (list): A list of document data to insert.
 
+            Returns:
+                int: The number of documents inserted, the ones inserted before a failure are counted.
         """
         collection = self.db[collection_name]
         try:
             result = collection.insert_many(data_to_insert)
             self.log.info(
                 f"Successfully inserted {len(result.inserted_ids)} documents.")
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            self.log.info(f"Insertion failed for {len(e.details['writeErrors'])} documents")
+            return e.details["nInserted"]
         except Exception as e:
             self.log.info(str(e))
+            return 0
 
     def delete_document(self, collection_name, query):
         """
@@ -109,11 +161,15 @@ class MongoSDK(MongoConfig):
             Args:
                 collection_name (str): The name of the collection to delete documents from.
                 query (dict): The query to filter the documents to delete.
+
+            Returns:
+                pymongo.results.DeleteResult: The result of the deletion operation.
         """
         collection = self.db[collection_name]
         delete_result = collection.delete_many(query)
         self.log.info(
             f"Deletion result: {delete_result.deleted_count} documents deleted")
+        return delete_result
 
     def update_document(self, collection_name, query, update_data):
         """
@@ -129,10 +185,86 @@ class MongoSDK(MongoConfig):
         self.log.info(
             f"Update result: {update_result.modified_count} documents updated")
 
+    def bulk_write(self, collection_name, operations, ordered=False):
+        """
+            Run a batch of write operations in a single bulk_write.
+
+            Args:
+                collection_name (str): The name of the collection.
+                operations (list): pymongo InsertOne, UpdateOne, DeleteOne... operations.
+                ordered (bool): Stop at the first failed operation. Unordered batches run every operation.
+
+            Returns:
+                dict: The number of documents inserted, modified and deleted, and the indexes of the failed operations.
+        """
+        collection = self.db[collection_name]
+        try:
+            result = collection.bulk_write(operations, ordered=ordered)
+            return {"inserted": result.inserted_count, "modified": result.modified_count,
+                    "deleted": result.deleted_count, "failed": []}
+        except BulkWriteError as e:
+            self.log.info(f"Bulk write failed for {len(e.details['writeErrors'])} operations")
+            return {"inserted": e.details["nInserted"], "modified": e.details["nModified"],
+                    "deleted": e.details["nRemoved"],
+                    "failed": [error["index"] for error in e.details["writeErrors"]]}
+
     def get_current_doc_count(self, collection_name):
         collection = self.db[collection_name]
         return collection.count_documents({})
 
-    def get_random_doc(self, collection_name):
+    def get_estimated_doc_count(self, collection_name):
+        """
+            Get the document count of the collection from its metadata, without counting the documents.
+        """
+        collection = self.db[collection_name]
+        return collection.estimated_document_count()
+
+    def get_random_doc(self, collection_name, projection=None):
+        """
+            Get a random document of the collection with a $sample aggregation.
+
+            Args:
+                collection_name (str): The name of the collection.
+                projection (dict): The fields to return, eg: {"_id": 1}. All of them by default.
+
+            Returns:
+                dict: The document, None if the collection is empty.
+        """
+        collection = self.db[collection_name]
+        pipeline = [{"$sample": {"size": 1}}]
+        if projection:
+            pipeline.append({"$project": projection})
+        return next(collection.aggregate(pipeline), None)
+
+    def iter_document_ids(self, collection_name, batch_size=10000):
+        """
+            Iterate over the _id of every document of the collection, read in batches by an _id only cursor.
+
+            Args:
+                collection_name (str): The name of the collection.
+                batch_size (int): The number of _ids returned per round trip.
+
+            Returns:
+                generator: The _id values.
+        """
+        collection = self.db[collection_name]
+        for document in collection.find({}, {"_id": 1}, batch_size=batch_size):
+            yield document["_id"]
+
+    def iter_random_document_ids(self, collection_name, count, batch_size=10000):
+        """
+            Iterate over the _id of count random documents of the collection, picked by a $sample aggregation.
+            The same _id can be returned more than once.
+
+            Args:
+                collection_name (str): The name of the collection.
+                count (int): The number of documents to sample.
+                batch_size (int): The number of _ids returned per round trip.
+
+            Returns:
+                generator: The _id values.
+        """
         collection = self.db[collection_name]
-        return collection.find_one({})
+        pipeline = [{"$sample": {"size": count}}, {"$project": {"_id": 1}}]
+        for document in collection.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size):
+            yield document["_id"]
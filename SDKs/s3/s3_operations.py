@@ -11,11 +11,14 @@ from faker import Faker
 from fastavro import writer, parse_schema
 
 import Docloader.docgen_template as template
+import Docloader.template_registry as template_registry
 
 
 class s3Operations:
     def __init__(self):
         self.faker = Faker()
+        # compiled on first use, so s3 loaders which do not generate files do not pay for it
+        self.template = None
 
     def create_file_with_required_file_type(self, file_type, doc_size=1024, num_rows=1):
         if file_type == "json":
@@ -94,44 +97,16 @@ class s3Operations:
         table.to_parquet(output_parquet, index=False, engine='pyarrow')
         return output_parquet
 
+    def get_template(self):
+        """
+        Returns the s3_hotel template files are generated from, compiling it on first use
+        """
+        if not self.template:
+            self.template = template_registry.get_template("s3_hotel")
+        return self.template
+
     def _generate_data(self, doc_size=1024):
-        data = {
-            "address": self.faker.address(),
-            "avg_ratings": self.faker.pyfloat(left_digits=1, right_digits=1, positive=True),
-            "city": self.faker.city(),
-            "country": self.faker.country(),
-            "email": self.faker.email(),
-            "free_breakfast": int(self.faker.boolean()),
-            "free_parking": int(self.faker.boolean()),
-            "name": self.faker.name(),
-            "phone": self.faker.random_element(
-                elements=(1000.0, 2000.0, 3000.0, 4000.0, 5000.0, 6000.0,
-                          7000.0, 8000.0, 9000.0, 10000.0)),
-            "price": self.faker.random_element(
-                elements=(1000.0, 2000.0, 3000.0, 4000.0, 5000.0, 6000.0,
-                          7000.0, 8000.0, 9000.0, 10000.0)),
-            "public_likes": [self.faker.word() for _ in range(5)],
-            "reviews": [
-                {
-                    "date": self.faker.date_time_this_decade().isoformat(),
-                    "author": self.faker.name(),
-                    "rating": {
-                        "value": random.randint(1, 10),
-                        "cleanliness": random.randint(1, 10),
-                        "overall": random.randint(1, 10)
-                    }
-                } for _ in range(2)
-            ],
-            "type": "Hotel",
-            "url": self.faker.url()
-        }
-
-        # Ensure the doc size
-        extra_size = doc_size - len(str(data))
-        if extra_size > 0:
-            data["extra"] = ''.join(random.choices(string.ascii_letters, k=extra_size))
-
-        return data
+        return self.get_template().generate(random, doc_size)
 
     def _generate_data_multiple_rows(self, num_rows, doc_size=1024, num_workers=1):
         data_list = []
@@ -24,6 +24,21 @@ loader_collection = loader_sdk.db[loader_collection_name]
 loaderIdvsDocobject = {}
 
 
+def create_docloader(params, **kwargs):
+    """
+    Create a DocLoader configured with the document generation parameters of the request body
+    :param params: request body
+    :param kwargs: any other DocLoader arguments
+    """
+    return DocLoader(document_size=params.get("document_size", 1024),
+                     generation_mode=params.get("generation_mode", "faker"),
+                     num_generator_processes=params.get("num_generator_processes", 0),
+                     seed=params.get("seed", None),
+                     pre_serialize=params.get("pre_serialize", False),
+                     template=params.get("template", "hotel"),
+                     document_size_distribution=params.get("document_size_distribution", None), **kwargs)
+
+
 def check_request_body(params, checklist):
     for check in checklist:
         if check not in params:
@@ -43,18 +58,21 @@ def start_mongo_loader():
 
     params_check = check_request_body(params, checklist)
     if params_check[1] != 422:
-        loader_data = {"docloader": DocLoader(document_size=params.get("document_size", 1024)), "status": "running",
+        loader_data = {"docloader": create_docloader(params), "status": "running",
                        "database": params['database_name'], "collection": params['collection_name']}
 
         if params['atlas_url']:
             mongo_config = MongoConfig(params['ip'], params['port'], params['username'], params['password'],
-                                       params['database_name'], params['atlas_url'])
+                                       params['database_name'], params['atlas_url'], params.get('max_pool_size', None),
+                                       params.get('min_pool_size', None))
         else:
             mongo_config = MongoConfig(params['ip'], params['port'], params['username'], params['password'],
-                                       params['database_name'])
+                                       params['database_name'], max_pool_size=params.get('max_pool_size', None),
+                                       min_pool_size=params.get('min_pool_size', None))
 
         thread1 = threading.Thread(target=loader_data['docloader'].setup_initial_load_on_mongo,
-                                   args=(mongo_config, params['collection_name'], params['initial_doc_count']))
+                                   args=(mongo_config, params['collection_name'], params['initial_doc_count'],
+                                         params.get('num_generators', 4), params.get('num_writers', 8)))
         thread1.start()
 
         del loader_data['docloader']
@@ -122,17 +140,23 @@ def start_mongo_crud():
             # Start a new loader
             loader_id = str(uuid.uuid4())
 
-            loader_data = {"loader_id": loader_id, "docloader": DocLoader(document_size=params.get("document_size", 1024)), "status": "running",
+            loader_data = {"loader_id": loader_id, "docloader": create_docloader(params), "status": "running",
                            "database": params['database_name'], "collection": params['collection_name']}
 
             if params['atlas_url']:
                 mongo_config = MongoConfig(params['ip'], params['port'], params['username'], params['password'],
-                                           params['database_name'], params['atlas_url'])
+                                           params['database_name'], params['atlas_url'],
+                                           params.get('max_pool_size', None), params.get('min_pool_size', None))
             else:
                 mongo_config = MongoConfig(params['ip'], params['port'], params['username'], params['password'],
-                                           params['database_name'])
+                                           params['database_name'], max_pool_size=params.get('max_pool_size', None),
+                                           min_pool_size=params.get('min_pool_size', None))
             thread1 = threading.Thread(target=loader_data['docloader'].perform_crud_on_mongo,
-                                       args=(mongo_config, params['collection_name'], params.get('num_buffer', 0)))
+                                       args=(mongo_config, params['collection_name'], params.get('num_buffer', 0),
+                                             params.get('random_selection', "reservoir"),
+                                             params.get('bulk_batch_size', 0), params.get('flush_interval', 1),
+                                             params.get('recount_interval', None),
+                                             params.get('exact_recount', False)))
             thread1.start()
 
             loaderIdvsDocobject[loader_id] = loader_data['docloader']
@@ -203,6 +227,8 @@ def get_docs_in_mongo():
                 "error": str(e)
             }
             return jsonify(rv), 200
+        finally:
+            mongo_sdk.close_mongoDB_connection()
 
     else:
         return params_check
@@ -228,6 +254,8 @@ def drop_mongo_database():
                 "Error": str(e)
             }
             return jsonify(rv), 200
+        finally:
+            mongo_sdk.close_mongoDB_connection()
 
     else:
         return params_check
@@ -253,6 +281,8 @@ def drop_mongo_collection():
                 "error": str(e)
             }
             return jsonify(rv), 200
+        finally:
+            mongo_sdk.close_mongoDB_connection()
 
     else:
         return params_check
@@ -306,7 +336,7 @@ def start_dynamo_loader():
         except Exception as err:
             print(str(err))
 
-        loader_data = {"docloader": DocLoader(document_size=params.get("document_size", 1024), no_of_docs=1), "status": "running",
+        loader_data = {"docloader": create_docloader(params, no_of_docs=1), "status": "running",
                        "database": params['table_name'], "collection": params['table_name']}
 
         thread1 = threading.Thread(target=loader_data['docloader'].setup_inital_load_on_dynamo_db,
@@ -390,7 +420,7 @@ def start_dynamo_crud():
                 return jsonify(rv), 409
             loader_id = str(uuid.uuid4())
 
-            loader_data = {"loader_id": loader_id, "docloader": DocLoader(document_size=params.get("document_size", 1024), no_of_docs=1), "status": "running",
+            loader_data = {"loader_id": loader_id, "docloader": create_docloader(params, no_of_docs=1), "status": "running",
                            "database": params['table_name'], "collection": params['table_name']}
 
             thread1 = threading.Thread(target=loader_data['docloader'].perform_crud_on_dynamodb,
@@ -398,7 +428,10 @@ def start_dynamo_crud():
                                              params['primary_key_field'],
                                              params.get('session_token', None),
                                              params['table_name'], params.get('num_buffer', 0),
-                                             params.get("add_id_key", False)))
+                                             params.get("add_id_key", False), params.get("ops_per_sec", None),
+                                             params.get("num_workers", 4), params.get("operation_mix", None),
+                                             params.get("read_workers", 0), params.get("reads_per_sec", None),
+                                             params.get("keys_per_read", 100), params.get("query_ratio", 0.0)))
             thread1.start()
 
             loaderIdvsDocobject[loader_id] = loader_data['docloader']
@@ -457,7 +490,8 @@ def get_docs_in_dynamo():
 
             dynamo_object = DynamoDb(params['access_key'], params['secret_key'], params['region'],
                                      params.get("session_token", None), params["table_name"])
-            count = dynamo_object.get_live_item_count()
+            count = dynamo_object.get_live_item_count(params.get("scan_segments", None),
+                                                      params.get("approximate", False))
             rv = {
                 "count": count
             }
@@ -539,7 +573,7 @@ def start_s3_loader():
         else:
             loader_id = str(uuid.uuid4())
 
-            loader_data = {"loader_id": loader_id, "docloader": DocLoader(document_size=params.get("document_size", 1024)), "status": "running",
+            loader_data = {"loader_id": loader_id, "docloader": create_docloader(params), "status": "running",
                            "database": "", "collection": ""}
 
             s3_config = s3Config(params['access_key'], params['secret_key'], params['region'], params['num_buckets'],
@@ -649,7 +683,7 @@ def restore_s3_bucket():
                                  params.get('file_size', 1024), params.get('max_file_size', 10240),
                                  params.get('file_format', ['json', 'csv', 'tsv']))
 
-            DocLoader(document_size=params.get("document_size", 1024)).restore_s3(
+            create_docloader(params).restore_s3(
                 s3SDK(params['access_key'], params['secret_key'], params.get('session_token', None)),
                 params['bucket_name'], s3_config)
             rv = {
@@ -687,7 +721,7 @@ def start_mysql_loader():
     params_check = check_request_body(params, checklist)
     if params_check[1] != 422:
 
-        loader_data = {"docloader": DocLoader(document_size=params.get("document_size", 1024)), "status": "running",
+        loader_data = {"docloader": create_docloader(params), "status": "running",
                        "database": params['database_name'], "collection": params['table_name']}
 
         mysql_config = MySQLConfig(host=params['host'], port=params['port'], username=params['username'],
@@ -766,7 +800,7 @@ def start_mysql_crud():
         else:
             loader_id = str(uuid.uuid4())
 
-            loader_data = {"loader_id": loader_id, "docloader": DocLoader(document_size=params.get("document_size", 1024)), "status": "running",
+            loader_data = {"loader_id": loader_id, "docloader": create_docloader(params), "status": "running",
                            "database": params['database_name'], "collection": params['table_name']}
 
             mysql_config = MySQLConfig(host=params['host'], port=params['port'], username=params['username'],
@@ -915,9 +949,9 @@ def restore_mysql_table():
         mysql_config = MySQLConfig(host=params['host'], port=params['port'], username=params['username'],
                                    password=params['password'])
         try:
-            DocLoader(document_size=params.get("document_size", 1024)).rebalance_mysql_docs(doc_count=params['doc_count'], table_name=params['table_name'],
-                                             table_columns=params['table_columns'], config=mysql_config,
-                                             database_name=params['database_name'])
+            create_docloader(params).rebalance_mysql_docs(doc_count=params['doc_count'], table_name=params['table_name'],
+                                                          table_columns=params['table_columns'], config=mysql_config,
+                                                          database_name=params['database_name'])
             rv = {
                 "response": "SUCCESS"
             }